@@ -0,0 +1,225 @@
+import time
+import uuid
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pymupdf
+
+from packing import pack_texts
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that at most rpm requests start per minute.
+    """
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, cancel_event: threading.Event | None = None):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = max(0.0, self.next_time - now)
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time:
+            if cancel_event is not None:
+                cancel_event.wait(wait_time)
+            else:
+                time.sleep(wait_time)
+
+
+rate_limiters: dict[str, RateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, rpm: int):
+    """
+    Rate limiters are shared per provider, so concurrent jobs on the same provider share the budget.
+    """
+    with rate_limiters_lock:
+        limiter = rate_limiters.get(provider)
+        if limiter is None or limiter.interval != (60.0 / rpm if rpm else 0.0):
+            limiter = rate_limiters[provider] = RateLimiter(rpm)
+        return limiter
+
+
+class BatchTranslationJob:
+    """
+    Translate every untranslated block of a page range with a bounded thread pool.
+
+    Results are written through PDFTranslator.save_translation. Failed requests are retried
+    with exponential backoff; blocks that still fail are counted and skipped.
+
+    With pack_token_budget > 0, blocks of the same and neighbouring pages are packed into
+    one request (see PDFTranslator.translate_blocks) up to that many estimated tokens.
+    """
+
+    def __init__(
+        self,
+        translator,
+        model_selection: list | None = None,
+        extra_requirements: str = "",
+        start_page: int = 0,
+        end_page: int | None = None,
+        concurrency: int = 4,
+        rpm: int = 0,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        pack_token_budget: int = 0,
+    ):
+        self.id = uuid.uuid4().hex
+        self.translator = translator
+        self.model_selection = model_selection or translator.model_selection
+        self.extra_requirements = extra_requirements
+        self.start_page = start_page
+        self.end_page = len(translator.doc) - 1 if end_page is None else end_page
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = get_rate_limiter(self.model_selection[0].lower(), rpm)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pack_token_budget = pack_token_budget
+
+        self.status = "pending"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.current_page = start_page
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"batch-translate-{self.id}", daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def progress(self):
+        with self.lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "current_page": self.current_page,
+                "start_page": self.start_page,
+                "end_page": self.end_page,
+                "errors": self.errors[-10:],
+                "elapsed": (self.finished_at or time.time()) - self.started_at if self.started_at else 0,
+            }
+
+    def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                # 所有提交过的任务，结束时逐个检查异常；futures 只是还没完成的任务
+                submitted = []
+                futures = []
+                pending_items = []
+                for page_num in range(self.start_page, self.end_page + 1):
+                    if self.cancel_event.is_set():
+                        break
+                    self.current_page = page_num
+                    items = [
+                        (page_num, block_index, block)
+                        for block_index, block in enumerate(self.translator.get_page_info(page_num)["blocks"])
+                        if not block["translated"] and not block.get("is_extra")
+                    ]
+                    with self.lock:
+                        self.total += len(items)
+                    pending_items.extend(items)
+                    groups = self.group_items(pending_items)
+                    # 最后一组可能还没装满，留给下一页继续打包
+                    if self.pack_token_budget and groups:
+                        pending_items = groups.pop()
+                    else:
+                        pending_items = []
+                    for group in groups:
+                        futures.append(executor.submit(self.translate_and_save, group))
+                        submitted.append(futures[-1])
+                    # 不让页面解析跑得比翻译快太多
+                    while sum(not future.done() for future in futures) > self.concurrency * 4:
+                        wait(futures, timeout=0.5)
+                        futures = [future for future in futures if not future.done()]
+                        if self.cancel_event.is_set():
+                            break
+                if pending_items and not self.cancel_event.is_set():
+                    submitted.append(executor.submit(self.translate_and_save, pending_items))
+                if self.cancel_event.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+            crashed = [future.exception() for future in submitted if not future.cancelled()]
+            crashed = [e for e in crashed if e is not None]
+            if crashed:
+                with self.lock:
+                    self.errors.extend(str(e) for e in crashed)
+                self.status = "failed"
+            else:
+                self.status = "cancelled" if self.cancel_event.is_set() else "finished"
+        except Exception as e:
+            self.status = "failed"
+            with self.lock:
+                self.errors.append(str(e))
+        finally:
+            self.finished_at = time.time()
+            # 任务记录会保留一段时间，不让它继续引用文档
+            self.translator = None
+
+    def group_items(self, items: list):
+        if not self.pack_token_budget:
+            return [[item] for item in items]
+        groups = pack_texts([block["text"] for _, _, block in items], self.pack_token_budget)
+        return [[items[index] for index in group] for group in groups]
+
+    def translate_and_save(self, items: list):
+        texts = [block["text"] for _, _, block in items]
+        for attempt in range(self.max_retries + 1):
+            if self.cancel_event.is_set():
+                return
+            try:
+                # 每个 LLM 请求（包括打包解析失败后的逐块请求）之前都要经过限流
+                translations = self.translator.translate_blocks(
+                    texts,
+                    self.model_selection,
+                    self.extra_requirements,
+                    before_request=lambda: self.rate_limiter.acquire(self.cancel_event),
+                )
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    page_num, block_index, _ = items[0]
+                    with self.lock:
+                        self.failed += len(items)
+                        self.errors.append(f"page {page_num} block {block_index}: {e}")
+                    return
+                # 指数退避，加上随机抖动避免同时重试
+                self.cancel_event.wait(self.backoff * 2**attempt + random.uniform(0, self.backoff))
+
+        for (page_num, block_index, block), translation in zip(items, translations):
+            try:
+                self.translator.save_translation(
+                    page_num,
+                    block_index,
+                    translation,
+                    block["text"],
+                    block["originalRect"],
+                    block["font_size"],
+                    block["color"],
+                    block.get("align", pymupdf.TEXT_ALIGN_LEFT),
+                )
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                    self.errors.append(f"page {page_num} block {block_index}: {e}")
+                continue
+            with self.lock:
+                self.done += 1
@@ -0,0 +1,634 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import pymupdf
+
+from export import export_serial, export_parallel, export_incremental
+from fonts import DocumentFont
+from layout import extract_page_blocks, is_valid_text
+from render import add_textbox, render_page_translations
+from sessions import ChatClientPool
+from translation_store import TranslationStore, ShardedTranslationStore, TranslationJournal, atomic_write_json
+from translator import PDFTranslator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+source_segment_re = re.compile(r'<原文片段(?: id="(\d+)")?>(.*?)</原文片段>', re.DOTALL)
+
+
+def make_synthetic_pdf(
+    path: str, page_count: int = 2, blocks_per_page: int = 300, seed: int = 0, max_words: int = 8
+):
+    """
+    Generate a PDF with many small text blocks of mixed font sizes and colors,
+    an outline entry per page and a link from every page to the page half the document away.
+    Blocks have 2 to max_words words, blocks that don't fit their box are left out by insert_textbox.
+    """
+    rnd = random.Random(seed)
+    doc = pymupdf.open()
+    columns = 4
+    rows = (blocks_per_page + columns - 1) // columns
+    for page_num in range(page_count):
+        page = doc.new_page(width=612, height=20 + rows * 30)
+        for i in range(blocks_per_page):
+            x = 10 + (i % columns) * 150
+            y = 10 + (i // columns) * 30
+            text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, max(2, max_words))))
+            page.insert_textbox(
+                pymupdf.Rect(x, y, x + 140, y + 26),
+                text,
+                fontsize=rnd.choice([6, 7, 8]),
+                color=rnd.choice([(0, 0, 0), (1, 0, 0), (0, 0, 0.5)]),
+            )
+    for page in doc:
+        target = (page.number + page_count // 2) % page_count
+        page.insert_link({"kind": pymupdf.LINK_GOTO, "from": pymupdf.Rect(0, 0, 10, 10), "page": target})
+    doc.set_toc([[1, f"Page {page_num + 1}", page_num + 1] for page_num in range(page_count)])
+    doc.save(path)
+    doc.close()
+
+
+def legacy_page_blocks(page: pymupdf.Page):
+    """
+    The per-block extraction used before layout.extract_page_blocks: one search_for per block
+    for the font size, another search_for plus a full get_text("dict") per block for the color.
+    """
+
+    def get_font_size(block):
+        text_instances = page.search_for(block[4].strip())
+        if text_instances:
+            rect = text_instances[0]
+            return rect.y1 - rect.y0
+        return 12
+
+    def get_text_color(block):
+        text_instances = page.search_for(block[4].strip())
+        if not text_instances:
+            return (0, 0, 0)
+        rect = text_instances[0]
+        for span in page.get_text("dict")["blocks"]:
+            for line in span.get("lines", []):
+                for span in line["spans"]:
+                    if pymupdf.Rect(span["bbox"]) == rect:
+                        color_int = span["color"]
+                        r = (color_int >> 16) & 0xFF
+                        g = (color_int >> 8) & 0xFF
+                        b = color_int & 0xFF
+                        return (r / 255.0, g / 255.0, b / 255.0)
+        return (0, 0, 0)
+
+    valid_blocks = []
+    for block in page.get_text("blocks"):
+        if is_valid_text(block[4]):
+            valid_blocks.append(
+                {
+                    "originalRect": block[:4],
+                    "rect": block[:4],
+                    "text": block[4].strip(),
+                    "font_size": get_font_size(block),
+                    "color": get_text_color(block),
+                }
+            )
+    return valid_blocks
+
+
+def legacy_add_textbox(page: pymupdf.Page, rect: pymupdf.Rect, text: str, initial_font_size: float, min_font_size=5):
+    """
+    The fitting loop used before render.add_textbox: one real insertion per 0.5pt step.
+    """
+    font_size = initial_font_size
+    while font_size >= min_font_size:
+        if page.insert_textbox(rect, text, fontsize=font_size, fontname="helv") >= 0:
+            return font_size
+        font_size -= 0.5
+    return None
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_layout(workdir: Path, args):
+    pdf_path = workdir / "layout.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=args.pages, blocks_per_page=args.blocks)
+    doc = pymupdf.open(pdf_path)
+    legacy_total = single_pass_total = 0.0
+    for page in doc:
+        legacy_time, legacy_blocks = timed(legacy_page_blocks, page)
+        single_pass_time, blocks = timed(extract_page_blocks, page)
+        assert [(b["rect"], b["text"]) for b in legacy_blocks] == [(b["rect"], b["text"]) for b in blocks]
+        legacy_total += legacy_time
+        single_pass_total += single_pass_time
+        print(
+            f"page {page.number}: {len(blocks)} blocks, "
+            f"per-block {legacy_time * 1000:.1f} ms, single-pass {single_pass_time * 1000:.1f} ms"
+        )
+    doc.close()
+    print(f"total: per-block {legacy_total:.3f} s, single-pass {single_pass_total:.3f} s")
+
+
+def make_translation_records(page_blocks: list):
+    return [
+        {
+            "original": block["text"],
+            "translation": block["text"].upper(),
+            "rect": list(block["rect"]),
+            "new_rect": list(block["rect"]),
+            "font_size": block["font_size"],
+            "color": list(block["color"]),
+            "align": pymupdf.TEXT_ALIGN_LEFT,
+        }
+        for block in page_blocks
+    ]
+
+
+def legacy_upsert(page_translations: list, record: dict):
+    existing = next(
+        (
+            item
+            for item in page_translations
+            if tuple(item["rect"]) == tuple(record["rect"]) and item["original"] == record["original"]
+        ),
+        None,
+    )
+    if existing:
+        existing.update(record)
+    else:
+        page_translations.append(record)
+
+
+def bench_store(workdir: Path, args):
+    pdf_path = workdir / "store.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=1, blocks_per_page=args.blocks)
+    doc = pymupdf.open(pdf_path)
+    records = make_translation_records(extract_page_blocks(doc[0]))
+    doc.close()
+
+    def run_legacy():
+        page_translations = []
+        for record in records + records:
+            legacy_upsert(page_translations, dict(record))
+
+    def run_store():
+        store = TranslationStore(1)
+        for record in records + records:
+            store.upsert(0, dict(record))
+
+    legacy_time, _ = timed(run_legacy)
+    store_time, _ = timed(run_store)
+    print(
+        f"{len(records)} records inserted then updated: "
+        f"linear scan {legacy_time * 1000:.1f} ms, indexed store {store_time * 1000:.1f} ms"
+    )
+
+
+def bench_save(workdir: Path, args):
+    pdf_path = workdir / "save.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=1, blocks_per_page=args.blocks)
+    doc = pymupdf.open(pdf_path)
+    records = make_translation_records(extract_page_blocks(doc[0]))
+    doc.close()
+
+    json_path = workdir / "save.json"
+    journal = TranslationJournal(str(workdir / "save.journal.jsonl"), compact_every=10**9)
+    for page_count in (10, 100, 1000):
+        store = TranslationStore(page_count)
+        for page_num in range(page_count):
+            for record in records:
+                store.upsert(page_num, dict(record))
+
+        def full_rewrite():
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(store.to_dict(), f, ensure_ascii=False, indent=4)
+
+        rewrite_time, _ = timed(full_rewrite)
+        append_time, _ = timed(journal.append, {"op": "upsert", "page_num": 0, "record": records[0]})
+        compact_time, _ = timed(atomic_write_json, json_path, store.to_dict(), ensure_ascii=False, indent=4)
+        print(
+            f"{page_count} pages: full rewrite {rewrite_time * 1000:.1f} ms, "
+            f"journal append {append_time * 1000:.3f} ms, compaction {compact_time * 1000:.1f} ms"
+        )
+    journal.clear()
+
+
+def bench_storage(workdir: Path, args):
+    """
+    Whole translations.json in memory vs pages loaded on demand from SQLite: time and Python
+    memory peak to open the progress, read one page, edit a record and save.
+    """
+    pdf_path = workdir / "storage.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=1, blocks_per_page=args.blocks)
+    doc = pymupdf.open(pdf_path)
+    records = make_translation_records(extract_page_blocks(doc[0]))
+    doc.close()
+
+    for page_count in (100, 1000):
+        json_path = workdir / f"storage-{page_count}.json"
+        db_path = workdir / f"storage-{page_count}.db"
+        db_path.unlink(missing_ok=True)
+        store = TranslationStore(page_count)
+        for page_num in range(page_count):
+            for record in records:
+                store.upsert(page_num, dict(record))
+        atomic_write_json(json_path, store.to_dict(), ensure_ascii=False, indent=4)
+        del store
+        ShardedTranslationStore(str(db_path), page_count).import_json(str(json_path))
+
+        def json_session():
+            with open(json_path, "r", encoding="utf-8") as f:
+                store = TranslationStore.from_dict(json.load(f), page_count)
+            store.page_records(page_count // 2)
+            store.upsert(0, dict(records[0], translation="edited"))
+            atomic_write_json(json_path, store.to_dict(), ensure_ascii=False, indent=4)
+
+        def sqlite_session():
+            store = ShardedTranslationStore(str(db_path), page_count)
+            store.page_records(page_count // 2)
+            store.upsert(0, dict(records[0], translation="edited"))
+            store.close()
+
+        for name, session in (("json", json_session), ("sqlite", sqlite_session)):
+            seconds, _ = timed(session)
+            # tracemalloc 会拖慢 json 解析，内存单独跑一遍测量
+            tracemalloc.start()
+            session()
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{page_count} pages x {len(records)} records, {name}: open + read + edit + save "
+                f"{seconds * 1000:.1f} ms, Python peak {peak_memory / 1024 / 1024:.1f} MB"
+            )
+        json_path.unlink()
+        db_path.unlink()
+
+
+def page_digest(page: pymupdf.Page):
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(0.5, 0.5), alpha=False)
+    links = [(link["kind"], link.get("page")) for link in page.get_links()]
+    return page.get_text("text"), pix.digest, links
+
+
+def bench_export(workdir: Path, args):
+    pdf_path = workdir / "export.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=args.pages, blocks_per_page=args.blocks)
+    doc = pymupdf.open(pdf_path)
+    pages_translations = [make_translation_records(extract_page_blocks(page)) for page in doc]
+    doc.close()
+
+    font_name = "translation" if args.font_file else "helv"
+    serial_time, serial_doc = timed(export_serial, str(pdf_path), pages_translations, font_name, args.font_file)
+    parallel_time, parallel_doc = timed(
+        export_parallel, str(pdf_path), pages_translations, font_name, args.font_file, args.workers
+    )
+    identical = [page_digest(page) for page in serial_doc] == [page_digest(page) for page in parallel_doc]
+    identical = identical and serial_doc.get_toc() == parallel_doc.get_toc()
+    print(
+        f"{args.pages} pages: serial {serial_time:.2f} s, {args.workers} workers {parallel_time:.2f} s "
+        f"({serial_time / parallel_time:.1f}x), identical pages: {identical}"
+    )
+    print(f"output size: {len(serial_doc.tobytes(garbage=4, deflate=True, clean=True)) / 1024:.0f} KB")
+    parallel_doc.close()
+
+    # 改一页的译文后再导出：整体重新导出 vs 只重新渲染改动的页
+    previous_path = workdir / "export-previous.pdf"
+    serial_doc.save(previous_path, garbage=4, deflate=True, clean=True)
+    serial_doc.close()
+    changed_page = args.pages // 2
+    pages_translations[changed_page][0]["translation"] += " (edited)"
+    full_time, full_doc = timed(export_serial, str(pdf_path), pages_translations, font_name, args.font_file)
+    incremental_time, incremental_doc = timed(
+        export_incremental,
+        str(pdf_path),
+        str(previous_path),
+        pages_translations,
+        {changed_page},
+        font_name,
+        args.font_file,
+    )
+    identical = [page_digest(page) for page in full_doc] == [page_digest(page) for page in incremental_doc]
+    identical = identical and full_doc.get_toc() == incremental_doc.get_toc()
+    print(
+        f"1 of {args.pages} pages edited: full {full_time:.2f} s, incremental {incremental_time:.2f} s "
+        f"({full_time / incremental_time:.1f}x), identical pages: {identical}"
+    )
+    full_doc.close()
+    incremental_doc.close()
+
+
+def bench_fit(workdir: Path, args):
+    rnd = random.Random(0)
+    cases = []
+    for _ in range(args.blocks):
+        width, height = rnd.randint(20, 300), rnd.randint(8, 120)
+        text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 80)))
+        cases.append((pymupdf.Rect(10, 10, 10 + width, 10 + height), text, rnd.choice([8, 12, 24, 60])))
+
+    def run(fit):
+        doc = pymupdf.open()
+        sizes = [fit(doc.new_page(), rect, text, initial_font_size) for rect, text, initial_font_size in cases]
+        doc.close()
+        return sizes
+
+    legacy_time, legacy_sizes = timed(run, legacy_add_textbox)
+    fit_time, sizes = timed(
+        run, lambda page, rect, text, initial_font_size: add_textbox(page, rect, text, "helv", None, initial_font_size)
+    )
+    same = all(legacy is None or legacy == size for legacy, size in zip(legacy_sizes, sizes))
+    print(
+        f"{len(cases)} textboxes: linear {legacy_time:.2f} s, binary search {fit_time:.2f} s, same font sizes: {same}"
+    )
+
+
+def legacy_render_page_translations(page: pymupdf.Page, page_translations: list, font: DocumentFont):
+    """
+    The rendering used before render.redact_page: apply_redactions once per block, then the same
+    text insertion as render_page_translations.
+    """
+    for translation in page_translations:
+        page.add_redact_annot(pymupdf.Rect(*translation["rect"]))
+        page.apply_redactions(images=0, graphics=0, text=0)
+    return render_page_translations(page, page_translations, font, redact_rects=[])
+
+
+def bench_redact(workdir: Path, args):
+    font_name = "translation" if args.font_file else "helv"
+    for blocks_per_page in (10, 40, 80, 160, 320):
+        pdf_path = workdir / f"redact-{blocks_per_page}.pdf"
+        make_synthetic_pdf(str(pdf_path), page_count=args.pages, blocks_per_page=blocks_per_page)
+        with pymupdf.open(pdf_path) as doc:
+            pages_translations = [make_translation_records(extract_page_blocks(page)) for page in doc]
+
+        def render(render_page):
+            doc = pymupdf.open(pdf_path)
+            font = DocumentFont(font_name, args.font_file)
+            for page_num, page_translations in enumerate(pages_translations):
+                render_page(doc.load_page(page_num), page_translations, font)
+            return doc
+
+        times = []
+        digests = []
+        for render_page in (
+            legacy_render_page_translations,
+            render_page_translations,
+            lambda page, page_translations, font: render_page_translations(page, page_translations, font, True),
+        ):
+            render_time, doc = timed(render, render_page)
+            times.append(render_time * 1000 / args.pages)
+            digests.append([page_digest(page) for page in doc])
+            doc.close()
+        legacy_time, page_time, merged_time = times
+        blocks = sum(len(page_translations) for page_translations in pages_translations) / args.pages
+        print(
+            f"{blocks:.0f} blocks per page: per-block {legacy_time:.1f} ms/page, per-page {page_time:.1f} ms/page "
+            f"({legacy_time / page_time:.1f}x), merged {merged_time:.1f} ms/page, "
+            f"identical pages: {digests[0] == digests[1]}"
+        )
+
+
+class FakeChatClient:
+    """
+    Stand-in for the vectorvein chat clients: answers after a fixed latency with the upper-cased
+    source text, in the packed segment format when the request has numbered segments.
+    """
+
+    def __init__(self, latency: float = 0.0, stream: bool = False):
+        self.latency = latency
+        self.stream = stream
+        self.requests = 0
+
+    def create_completion(self, messages: list, model: str | None = None, temperature: float | None = None, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        segments = source_segment_re.findall(messages[-1]["content"])
+        if len(segments) == 1 and not segments[0][0]:
+            content = segments[0][1].upper()
+        else:
+            content = "\n".join(f'<译文片段 id="{number}">{text.upper()}</译文片段>' for number, text in segments)
+        if self.stream:
+            return (SimpleNamespace(content=content[i : i + 16]) for i in range(0, len(content), 16))
+        return SimpleNamespace(content=content)
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 返回字节，Linux 返回 KB
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def measure(results: list, operation: str, calls: int, func, *args, **kwargs):
+    """
+    Run func once (it performs calls operations) and record the total and mean time,
+    the peak of Python allocations (tracemalloc, MuPDF's own memory isn't included)
+    and the process max RSS so far.
+    """
+    tracemalloc.reset_peak()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    seconds, result = timed(func, *args, **kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    results.append(
+        {
+            "operation": operation,
+            "calls": calls,
+            "total_seconds": round(seconds, 6),
+            "mean_seconds": round(seconds / calls, 6) if calls else None,
+            "python_peak_kb": max(0, peak_memory - start_memory) // 1024,
+            "max_rss_kb": max_rss_kb(),
+        }
+    )
+    print(f"{operation}: {calls} calls, {seconds:.3f} s", file=sys.stderr)
+    return result
+
+
+def bench_translator(workdir: Path, args):
+    """
+    The PDFTranslator hot paths end to end, against a fake LLM provider. Results are JSON,
+    written to --output or printed, so runs can be compared across commits.
+    """
+    pdf_path = workdir / "translator.pdf"
+    make_synthetic_pdf(str(pdf_path), page_count=args.pages, blocks_per_page=args.blocks, max_words=args.words)
+    font_name = "translation" if args.font_file else "helv"
+    client_pool = ChatClientPool(create_client=lambda provider, stream=False: FakeChatClient(args.llm_latency, stream))
+    results = []
+
+    tracemalloc.start()
+    translator = measure(
+        results,
+        "init",
+        1,
+        PDFTranslator,
+        str(pdf_path),
+        str(workdir / "translator.json"),
+        str(workdir / "translator-translated.pdf"),
+        font_name,
+        args.font_file,
+        "中文",
+        ["openai", "gpt-4o-mini"],
+        client_pool=client_pool,
+        prefetch_radius=0,
+    )
+    pages = range(args.pages)
+    measure(results, "get_page_info (cold)", len(pages), lambda: [translator.get_page_info(p) for p in pages])
+    pages_blocks = measure(
+        results, "get_page_info (cached)", len(pages), lambda: [translator.get_page_info(p)["blocks"] for p in pages]
+    )
+
+    texts = [block["text"] for block in pages_blocks[0]]
+    single_texts, packed_texts, stream_texts = texts[:10], texts[10:30], texts[30:35]
+    measure(
+        results, "translate_block", len(single_texts), lambda: [translator.translate_block(t) for t in single_texts]
+    )
+    measure(results, "translate_blocks (packed)", len(packed_texts), translator.translate_blocks, packed_texts)
+    measure(
+        results,
+        "translate_block_stream",
+        len(stream_texts),
+        lambda: [list(translator.translate_block_stream(t)) for t in stream_texts],
+    )
+
+    def save_all():
+        for page_num, blocks in enumerate(pages_blocks):
+            for block_index, block in enumerate(blocks):
+                translator.save_translation(
+                    page_num,
+                    block_index,
+                    block["text"].upper(),
+                    block["text"],
+                    block["originalRect"],
+                    block["font_size"],
+                    block["color"],
+                    pymupdf.TEXT_ALIGN_LEFT,
+                )
+
+    measure(results, "save_translation", sum(len(blocks) for blocks in pages_blocks), save_all)
+
+    def add_textboxes():
+        doc = pymupdf.open()
+        page = doc.new_page(width=translator.doc[0].rect.width, height=translator.doc[0].rect.height)
+        font = DocumentFont(font_name, args.font_file)
+        for record in translator.get_page_records(0):
+            add_textbox(page, pymupdf.Rect(record["rect"]), record["translation"], font.prepare(page), None, 60)
+        doc.close()
+
+    measure(results, "add_textbox", len(pages_blocks[0]), add_textboxes)
+    measure(results, "preview_page (cold)", len(pages), lambda: [translator.preview_page(p) for p in pages])
+    measure(results, "preview_page (cached)", len(pages), lambda: [translator.preview_page(p) for p in pages])
+
+    def edit_and_preview():
+        for page_num in pages:
+            record = translator.get_page_records(page_num)[0]
+            translator.save_translation(
+                page_num,
+                0,
+                record["translation"] + " (edited)",
+                record["original"],
+                record["rect"],
+                record["font_size"],
+                record["color"],
+                record["align"],
+                record["new_rect"],
+            )
+            translator.preview_page(page_num)
+
+    measure(results, "preview_page (one block edited)", len(pages), edit_and_preview)
+    measure(results, "generate_translated_pdf", 1, translator.generate_translated_pdf)
+
+    def edit_and_export():
+        record = translator.get_page_records(0)[0]
+        translator.save_translation(
+            0,
+            0,
+            record["translation"] + " (edited again)",
+            record["original"],
+            record["rect"],
+            record["font_size"],
+            record["color"],
+            record["align"],
+            record["new_rect"],
+        )
+        return translator.generate_translated_pdf(incremental=True, fast_save=True)
+
+    measure(results, "generate_translated_pdf (incremental, one block edited)", 1, edit_and_export)
+    measure(results, "close", 1, translator.close)
+    tracemalloc.stop()
+
+    report = {
+        "benchmark": "translator",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pymupdf": pymupdf.VersionBind,
+        "params": {
+            "pages": args.pages,
+            "blocks": args.blocks,
+            "words": args.words,
+            "llm_latency": args.llm_latency,
+            "font_file": args.font_file,
+        },
+        "llm_requests": sum(client.requests for client in client_pool.clients.values()),
+        "operations": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"results written to {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+BENCHMARKS = {
+    "layout": bench_layout,
+    "store": bench_store,
+    "save": bench_save,
+    "storage": bench_storage,
+    "export": bench_export,
+    "fit": bench_fit,
+    "redact": bench_redact,
+    "translator": bench_translator,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run benchmarks on synthetic PDFs.")
+    parser.add_argument(
+        "benchmark", nargs="*", help=f"benchmarks to run, one of {', '.join(BENCHMARKS)} (default: all)"
+    )
+    parser.add_argument("-p", "--pages", type=int, default=2, help="number of pages in the synthetic PDF")
+    parser.add_argument("-b", "--blocks", type=int, default=300, help="number of text boxes per page")
+    parser.add_argument("-f", "--font-file", default=None, help="font file for exported translations")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="number of processes for parallel export")
+    parser.add_argument("-t", "--words", type=int, default=8, help="maximum number of words per text box")
+    parser.add_argument("-l", "--llm-latency", type=float, default=0.05, help="latency of the fake LLM, in seconds")
+    parser.add_argument("-o", "--output", default=None, help="write the translator benchmark JSON to this file")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.benchmark or BENCHMARKS:
+            print(f"== {name}", file=sys.stderr)
+            BENCHMARKS[name](Path(tmp), args)
@@ -0,0 +1,243 @@
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+started_at = time.perf_counter()
+
+EPILOG = """examples:
+  python cli.py translate --start-page 0 --end-page 9 --export
+  python cli.py export --incremental
+  python cli.py preview 3 -o page-3.webp
+  python cli.py --timing stats
+
+Document settings come from the config file (see config_template.json), options override them.
+Modules are imported by the commands that need them, export and preview never load the LLM SDK.
+For a full breakdown of the startup time run python -X importtime cli.py ...
+"""
+
+
+def load_config(args):
+    config_file = Path(args.config)
+    config = json.loads(config_file.read_text(encoding="utf-8")) if config_file.exists() else {}
+    overrides = {
+        "pdf_path": args.pdf,
+        "output_json_path": args.output_json,
+        "translated_pdf_path": args.translated_pdf,
+        "font_name": args.font_name,
+        "font_file": args.font_file,
+        "target_language": args.target_language,
+        "model_selection": args.model,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    missing = [key for key in ("pdf_path", "output_json_path", "translated_pdf_path") if not config.get(key)]
+    if missing:
+        raise SystemExit(f"Missing settings: {', '.join(missing)} (set them in {args.config} or as options)")
+    return config
+
+
+def open_translator(config, timings: dict):
+    start = time.perf_counter()
+    from translator import PDFTranslator
+    from translation_memory import TranslationMemory
+
+    timings["imports"] = time.perf_counter() - start
+    start = time.perf_counter()
+    translator = PDFTranslator(
+        config["pdf_path"],
+        config["output_json_path"],
+        config["translated_pdf_path"],
+        config.get("font_name", "helv"),
+        config.get("font_file"),
+        config.get("target_language", "zh-CN"),
+        config.get("model_selection", ["openai", "gpt-4o-mini"]),
+        translation_memory=TranslationMemory(config.get("translation_memory_path", "translation_memory.db")),
+        # 命令行没有翻页，不需要预取相邻页面
+        prefetch_radius=0,
+        translation_storage=config.get("translation_storage", "json"),
+        translation_cache_pages=int(config.get("translation_cache_pages", 64)),
+    )
+    timings["open"] = time.perf_counter() - start
+    return translator
+
+
+def page_range(translator, args):
+    end_page = len(translator.doc) - 1 if args.end_page is None else args.end_page
+    if not 0 <= args.start_page <= end_page < len(translator.doc):
+        raise SystemExit(f"Invalid page range {args.start_page}-{end_page}, the PDF has {len(translator.doc)} pages")
+    return args.start_page, end_page
+
+
+def export(translator, config, args):
+    return translator.generate_translated_pdf(
+        workers=args.workers or int(config.get("export_workers", 1)),
+        incremental=args.incremental or bool(config.get("incremental_export", False)),
+        fast_save=args.fast_save or bool(config.get("fast_save", False)),
+        merge_redactions=args.merge_redactions or bool(config.get("merge_redactions", False)),
+    )
+
+
+def command_translate(translator, config, args):
+    from vectorvein.settings import settings
+    from batch import BatchTranslationJob
+
+    credentials_file = Path(args.credentials)
+    settings.load(json.loads(credentials_file.read_text(encoding="utf-8")) if credentials_file.exists() else {})
+    start_page, end_page = page_range(translator, args)
+    provider = translator.model_selection[0].lower()
+    job = BatchTranslationJob(
+        translator,
+        extra_requirements=args.extra_requirements,
+        start_page=start_page,
+        end_page=end_page,
+        concurrency=args.concurrency,
+        rpm=args.rpm if args.rpm is not None else int(config.get("rate_limits", {}).get(provider, 0)),
+        max_retries=args.max_retries,
+        pack_token_budget=(
+            args.pack_token_budget if args.pack_token_budget is not None else int(config.get("pack_token_budget", 0))
+        ),
+    ).start()
+    try:
+        while job.thread.is_alive():
+            job.thread.join(timeout=args.progress_interval)
+            progress = job.progress()
+            print(
+                f"page {progress['current_page']}/{end_page}: {progress['done']}/{progress['total']} blocks, "
+                f"{progress['failed']} failed",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        job.cancel()
+        job.thread.join()
+    progress = job.progress()
+    print(json.dumps(progress, ensure_ascii=False, indent=2))
+    if progress["status"] != "finished" or progress["failed"]:
+        return 1
+    if args.export:
+        print(export(translator, config, args))
+    return 0
+
+
+def command_export(translator, config, args):
+    print(export(translator, config, args))
+    return 0
+
+
+def command_preview(translator, config, args):
+    from preview import parse_preview_options
+
+    if not 0 <= args.page < len(translator.doc):
+        raise SystemExit(f"Invalid page {args.page}, the PDF has {len(translator.doc)} pages")
+    output = Path(args.output or f"page-{args.page}.{args.format or 'png'}")
+    image_format = args.format or output.suffix.lstrip(".") or "png"
+    try:
+        scale, image_format, quality, clip = parse_preview_options(
+            {"scale": args.scale, "format": image_format, "quality": args.quality, "clip": args.clip}
+        )
+        # 裁剪区域在页面之外时 preview_page 也会抛出 ValueError
+        image = translator.preview_page(args.page, scale, image_format, quality, clip)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    output.write_bytes(image)
+    print(f"Preview of page {args.page} saved to {output}")
+    return 0
+
+
+def command_stats(translator, config, args):
+    from metrics import metrics
+
+    if args.layout:
+        # 提取所有页面的版面，缓存统计和耗时才有意义
+        for page_num in range(len(translator.doc)):
+            translator.get_page_info(page_num)
+    stats = {
+        "translations": translator.translation_stats(),
+        "cache": translator.page_cache_stats(),
+        "spans": metrics.snapshot()["spans"],
+    }
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+COMMANDS = {
+    "translate": command_translate,
+    "export": command_export,
+    "preview": command_preview,
+    "stats": command_stats,
+}
+
+
+def add_export_options(parser):
+    parser.add_argument("-w", "--workers", type=int, default=0, help="processes for rendering (default: config)")
+    parser.add_argument("--incremental", action="store_true", help="re-render only pages changed since the last export")
+    parser.add_argument("--fast-save", action="store_true", help="save without garbage collection, larger but faster")
+    parser.add_argument(
+        "--merge-redactions", action="store_true", help="merge overlapping blocks into one redaction before rendering"
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Translate and export PDFs without the web interface.",
+        epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-c", "--config", default="config.json", help="config file (default: config.json)")
+    parser.add_argument("--pdf", help="source PDF, overrides pdf_path")
+    parser.add_argument("--output-json", help="translation progress file, overrides output_json_path")
+    parser.add_argument("--translated-pdf", help="exported PDF, overrides translated_pdf_path")
+    parser.add_argument("--font-name", help="overrides font_name")
+    parser.add_argument("--font-file", help="overrides font_file")
+    parser.add_argument("--target-language", help="overrides target_language")
+    parser.add_argument("--model", nargs=2, metavar=("PROVIDER", "MODEL"), help="overrides model_selection")
+    parser.add_argument("--timing", action="store_true", help="print import, open and command times to stderr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    translate = subparsers.add_parser("translate", help="translate every untranslated block of a page range")
+    translate.add_argument("--start-page", type=int, default=0, help="first page, starting from 0")
+    translate.add_argument("--end-page", type=int, default=None, help="last page (default: the last page)")
+    translate.add_argument("--concurrency", type=int, default=4, help="parallel LLM requests")
+    translate.add_argument("--rpm", type=int, default=None, help="requests per minute (default: config rate_limits)")
+    translate.add_argument("--max-retries", type=int, default=3, help="retries of a failed request")
+    translate.add_argument("--pack-token-budget", type=int, default=None, help="pack blocks into one request")
+    translate.add_argument("--extra-requirements", default="", help="extra instructions for the model")
+    translate.add_argument("--credentials", default="llm_credentials.json", help="LLM credentials file")
+    translate.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    translate.add_argument("--export", action="store_true", help="export the translated PDF when done")
+    add_export_options(translate)
+
+    add_export_options(subparsers.add_parser("export", help="render the translations into the translated PDF"))
+
+    preview = subparsers.add_parser("preview", help="render a translated page to an image file")
+    preview.add_argument("page", type=int, help="page number, starting from 0")
+    preview.add_argument("-o", "--output", help="image file (default: page-<page>.<format>)")
+    preview.add_argument("--format", choices=["png", "jpeg", "jpg", "webp"], help="default: from the output suffix")
+    preview.add_argument("--scale", type=float, default=2.0, help="zoom factor (default: 2)")
+    preview.add_argument("--quality", type=int, default=80, help="JPEG and WebP quality (default: 80)")
+    preview.add_argument("--clip", help="only render x0,y0,x1,y1 in page coordinates")
+
+    stats = subparsers.add_parser("stats", help="print translation progress and cache statistics as JSON")
+    stats.add_argument("--layout", action="store_true", help="extract the layout of every page first")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config(args)
+    timings = {}
+    translator = open_translator(config, timings)
+    try:
+        start = time.perf_counter()
+        exit_code = COMMANDS[args.command](translator, config, args)
+        timings[args.command] = time.perf_counter() - start
+    finally:
+        translator.close()
+    if args.timing:
+        timings["total"] = time.perf_counter() - started_at
+        print(", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()), file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
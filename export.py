@@ -0,0 +1,189 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+
+from fonts import DocumentFont
+from render import pymupdf_lock, render_page_translations
+
+
+def export_serial(
+    pdf_path: str, pages_translations: list, font_name: str, font_file: str, subset_fonts=True, merge_redactions=False
+):
+    """
+    Open a fresh copy of the source PDF and render every page's translations into it.
+    With subset_fonts, embedded fonts are reduced to the glyphs actually used. With
+    merge_redactions, overlapping redaction rects are merged, see render.redact_page.
+
+    pymupdf_lock is taken page by page, so other requests can run between pages.
+    """
+    with pymupdf_lock:
+        doc = pymupdf.open(pdf_path)
+    font = DocumentFont(font_name, font_file)
+    for page_num, page_translations in enumerate(pages_translations):
+        if page_translations:
+            with pymupdf_lock:
+                render_page_translations(doc.load_page(page_num), page_translations, font, merge_redactions)
+    if subset_fonts:
+        with pymupdf_lock:
+            doc.subset_fonts()
+    return doc
+
+
+def export_chunk(
+    pdf_path: str,
+    from_page: int,
+    to_page: int,
+    chunk_translations: list,
+    font_name: str,
+    font_file: str,
+    subset_fonts=True,
+    merge_redactions=False,
+):
+    """
+    Process pool worker: render pages from_page..to_page of the source PDF.
+
+    Returns the rendered pages as PDF bytes, plus the links of each page: select() and
+    insert_pdf() drop links that point outside the chunk, so the caller restores them.
+    """
+    doc = pymupdf.open(pdf_path)
+    font = DocumentFont(font_name, font_file)
+    for page_num, page_translations in enumerate(chunk_translations, start=from_page):
+        if page_translations:
+            render_page_translations(doc.load_page(page_num), page_translations, font, merge_redactions)
+    links = [doc.load_page(page_num).get_links() for page_num in range(from_page, to_page + 1)]
+    doc.select(list(range(from_page, to_page + 1)))
+    if subset_fonts:
+        # 在 worker 里子集化，传回主进程的数据也更小
+        doc.subset_fonts()
+    data = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return data, links
+
+
+def split_pages(page_count: int, chunk_count: int):
+    chunk_size = math.ceil(page_count / chunk_count)
+    return [(start, min(start + chunk_size, page_count) - 1) for start in range(0, page_count, chunk_size)]
+
+
+def export_parallel(
+    pdf_path: str,
+    pages_translations: list,
+    font_name: str,
+    font_file: str,
+    workers: int,
+    subset_fonts=True,
+    merge_redactions=False,
+):
+    """
+    Split the pages into contiguous chunks, render them in a process pool and merge the parts
+    with insert_pdf. Links, metadata, outline and page labels are restored from the source PDF.
+    """
+    page_count = len(pages_translations)
+    # 每个 worker 分两块，避免某一块特别慢时其他 worker 空等
+    chunks = split_pages(page_count, max(1, min(page_count, workers * 2)))
+    # 不能用 fork：服务器的其他线程可能正持有 MuPDF 或 metrics 的锁，子进程继承到已锁住的锁会死锁
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(
+                export_chunk,
+                pdf_path,
+                from_page,
+                to_page,
+                pages_translations[from_page : to_page + 1],
+                font_name,
+                font_file,
+                subset_fonts,
+                merge_redactions,
+            )
+            for from_page, to_page in chunks
+        ]
+        parts = [future.result() for future in futures]
+
+    with pymupdf_lock:
+        return merge_parts(pdf_path, parts)
+
+
+def merge_parts(pdf_path: str, parts: list):
+    doc = pymupdf.open()
+    for data, _ in parts:
+        with pymupdf.open("pdf", data) as part:
+            doc.insert_pdf(part)
+    restore_document_info(doc, pdf_path, [links for _, chunk_links in parts for links in chunk_links])
+    return doc
+
+
+def restore_document_info(doc: pymupdf.Document, pdf_path: str, page_links: list):
+    """
+    Put back what insert_pdf loses when a document is assembled from pieces: the links of
+    each page (as read from the rendered pages), and the metadata, outline and page labels
+    of the source PDF.
+    """
+    source = pymupdf.open(pdf_path)
+    for page, links in zip(doc, page_links):
+        for link in page.get_links():
+            page.delete_link(link)
+        for link in links:
+            page.insert_link(link)
+    doc.set_metadata(source.metadata)
+    doc.set_toc(source.get_toc(simple=False))
+    page_labels = source.get_page_labels()
+    if page_labels:
+        doc.set_page_labels(page_labels)
+    source.close()
+
+
+def page_runs(page_nums: set, page_count: int):
+    """
+    Split 0..page_count-1 into runs of consecutive pages that are all in page_nums or all not,
+    as (in_page_nums, from_page, to_page).
+    """
+    runs = []
+    for page_num in range(page_count):
+        changed = page_num in page_nums
+        if runs and runs[-1][0] == changed:
+            runs[-1][2] = page_num
+        else:
+            runs.append([changed, page_num, page_num])
+    return [tuple(run) for run in runs]
+
+
+def export_incremental(
+    pdf_path: str,
+    previous_path: str,
+    pages_translations: list,
+    changed_pages: set,
+    font_name: str,
+    font_file: str,
+    subset_fonts=True,
+    merge_redactions=False,
+):
+    """
+    Rebuild the translated PDF from the previous export: the pages in changed_pages are
+    rendered again from the source PDF, all other pages are copied from previous_path.
+    """
+    with pymupdf_lock:
+        rendered = pymupdf.open(pdf_path)
+        previous = pymupdf.open(previous_path)
+    font = DocumentFont(font_name, font_file)
+    for page_num in sorted(changed_pages):
+        with pymupdf_lock:
+            render_page_translations(
+                rendered.load_page(page_num), pages_translations[page_num], font, merge_redactions
+            )
+
+    with pymupdf_lock:
+        if subset_fonts and changed_pages:
+            rendered.subset_fonts()
+        doc = pymupdf.open()
+        page_links = []
+        for changed, from_page, to_page in page_runs(changed_pages, len(pages_translations)):
+            part = rendered if changed else previous
+            # 同一个源文档多次 insert_pdf 共用一个 graft map，字体等共享对象只复制一次
+            doc.insert_pdf(part, from_page=from_page, to_page=to_page, links=False)
+            page_links += [part.load_page(page_num).get_links() for page_num in range(from_page, to_page + 1)]
+        restore_document_info(doc, pdf_path, page_links)
+        rendered.close()
+        previous.close()
+    return doc
@@ -0,0 +1,69 @@
+import hashlib
+import functools
+
+import pymupdf
+
+
+@functools.lru_cache(maxsize=8)
+def load_font(font_file: str):
+    """
+    Read and parse a font file once per process.
+    """
+    return pymupdf.Font(fontfile=font_file)
+
+
+def link_font(page: pymupdf.Page, resource_name: str, xref: int):
+    """
+    Add an already embedded font to the font resources of page, without loading it again.
+    Returns False when the page resources are inherited or unusual, the caller then inserts the font.
+    """
+    doc = page.parent
+    kind, value = doc.xref_get_key(page.xref, "Resources")
+    if kind == "xref":
+        resources_xref, prefix = int(value.split()[0]), ""
+    elif kind == "dict":
+        resources_xref, prefix = page.xref, "Resources/"
+    else:
+        return False
+
+    kind, value = doc.xref_get_key(resources_xref, f"{prefix}Font")
+    if kind == "xref":
+        doc.xref_set_key(int(value.split()[0]), resource_name, f"{xref} 0 R")
+    elif kind == "dict":
+        doc.xref_set_key(resources_xref, f"{prefix}Font/{resource_name}", f"{xref} 0 R")
+    elif kind == "null":
+        doc.xref_set_key(resources_xref, f"{prefix}Font", f"<</{resource_name} {xref} 0 R>>")
+    else:
+        return False
+    return True
+
+
+class DocumentFont:
+    """
+    The translation font of one document.
+
+    A font file is embedded once, on the first page that needs it, and later pages only get a
+    reference to the same font object. Built-in fonts (no font file) are used as they are.
+    """
+
+    def __init__(self, font_name: str, font_file: str | None):
+        self.font_name = font_name
+        self.font_file = font_file
+        self.xref = 0
+        if font_file:
+            # 资源名只用 ASCII，避免中文字体名写入 PDF 名称对象
+            self.resource_name = "F" + hashlib.sha1(f"{font_name}:{font_file}".encode("utf-8")).hexdigest()[:8]
+        else:
+            self.resource_name = font_name
+        self.pages = set()
+
+    def prepare(self, page: pymupdf.Page):
+        """
+        Make sure the font is available on page, returns the font name to pass to insert_textbox.
+        """
+        if not self.font_file or page.xref in self.pages:
+            return self.resource_name
+        if not (self.xref and link_font(page, self.resource_name, self.xref)):
+            self.xref = page.insert_font(fontname=self.resource_name, fontbuffer=load_font(self.font_file).buffer)
+        self.pages.add(page.xref)
+        return self.resource_name
@@ -0,0 +1,78 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, name: str, owner=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        # 任务所属的对象（例如 PDFTranslator），任务未结束时它不能被关闭
+        self.owner = owner
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs long operations (exports, previews of many pages...) on background threads,
+    so that requests can return a job id at once and poll for the status.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: dict[str, Job] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, func, *args, owner=None, **kwargs):
+        job = Job(name, owner)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._forget_finished_jobs()
+        self.executor.submit(self._run, job, func, *args, **kwargs)
+        return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def is_busy(self, owner):
+        with self.lock:
+            return any(job.owner is owner and job.finished_at is None for job in self.jobs.values())
+
+    def _run(self, job: Job, func, *args, **kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = func(*args, **kwargs)
+            job.status = "finished"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            # 结束的任务不再引用 owner，已关闭的文档不会因为任务记录而留在内存中
+            job.owner = None
+
+    def _forget_finished_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        for job in sorted(finished, key=lambda job: job.finished_at)[: -self.max_finished_jobs or None]:
+            del self.jobs[job.id]
@@ -0,0 +1,177 @@
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+import pymupdf
+
+
+valid_text_re = re.compile(r"[a-zA-Z0-9\u4e00-\u9fff]")
+
+DEFAULT_FONT_SIZE = 12
+DEFAULT_COLOR = (0, 0, 0)
+
+
+def is_valid_text(text: str):
+    return bool(valid_text_re.search(text))
+
+
+def color_int_to_rgb(color_int: int):
+    r = (color_int >> 16) & 0xFF
+    g = (color_int >> 8) & 0xFF
+    b = color_int & 0xFF
+    return (r / 255.0, g / 255.0, b / 255.0)
+
+
+def extract_page_blocks(page: pymupdf.Page):
+    """
+    Parse the page once and build the text blocks with their dominant font size and color.
+
+    The same text flags as page.get_text("blocks") are used, so block rects and texts are
+    identical to the ones stored in existing translation files.
+    """
+    blocks = []
+    page_dict = page.get_text("dict", flags=pymupdf.TEXTFLAGS_BLOCKS)
+    for block in page_dict["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+
+        lines = []
+        font_sizes = Counter()
+        colors = Counter()
+        for line in block.get("lines", []):
+            line_text = ""
+            for span in line["spans"]:
+                span_text = span["text"]
+                line_text += span_text
+                weight = len(span_text.strip())
+                if weight:
+                    # 按字符数加权，取占比最大的字号和颜色
+                    font_sizes[span["size"]] += weight
+                    colors[span["color"]] += weight
+            lines.append(line_text + "\n")
+
+        text = "".join(lines)
+        if not is_valid_text(text):
+            continue
+
+        rect = tuple(block["bbox"])
+        blocks.append(
+            {
+                "originalRect": rect,
+                "rect": rect,
+                "text": text.strip(),
+                "font_size": font_sizes.most_common(1)[0][0] if font_sizes else DEFAULT_FONT_SIZE,
+                "color": color_int_to_rgb(colors.most_common(1)[0][0]) if colors else DEFAULT_COLOR,
+            }
+        )
+    return blocks
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class LayoutCache:
+    """
+    Page layout cache keyed by PDF content hash and page number.
+
+    Extracted blocks are persisted in a SQLite sidecar file, with an in-memory LRU in front.
+    Entries of any other PDF hash are dropped when the cache is opened, so a modified PDF
+    never gets stale layouts.
+    """
+
+    def __init__(self, cache_path: str, pdf_hash: str, max_pages: int = 64):
+        self.cache_path = cache_path
+        self.pdf_hash = pdf_hash
+        self.max_pages = max_pages
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS layouts ("
+                "pdf_hash TEXT NOT NULL, page_num INTEGER NOT NULL, blocks TEXT NOT NULL, "
+                "PRIMARY KEY (pdf_hash, page_num))"
+            )
+            self.conn.execute("DELETE FROM layouts WHERE pdf_hash != ?", (pdf_hash,))
+
+    def get(self, page_num: int):
+        with self.lock:
+            blocks = self.memory.get(page_num)
+            if blocks is not None:
+                self.memory.move_to_end(page_num)
+                self.memory_hits += 1
+            else:
+                blocks = self._load(page_num)
+                if blocks is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                self._remember(page_num, blocks)
+        # 调用方会修改返回的 block，因此每次都返回副本
+        return [dict(block) for block in blocks]
+
+    def warm(self, page_num: int, remember: bool = True):
+        """
+        Whether page_num is cached, without counting a lookup. With remember, a page that is
+        only on disk is loaded into memory.
+        """
+        with self.lock:
+            if page_num in self.memory:
+                return True
+            if not remember:
+                return self.conn.execute(
+                    "SELECT 1 FROM layouts WHERE pdf_hash = ? AND page_num = ?", (self.pdf_hash, page_num)
+                ).fetchone() is not None
+            blocks = self._load(page_num)
+            if blocks is None:
+                return False
+            self._remember(page_num, blocks)
+            return True
+
+    def put(self, page_num: int, blocks: list, remember: bool = True):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO layouts (pdf_hash, page_num, blocks) VALUES (?, ?, ?)",
+                    (self.pdf_hash, page_num, json.dumps(blocks, ensure_ascii=False)),
+                )
+            if remember:
+                self._remember(page_num, [dict(block) for block in blocks])
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_pages": len(self.memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.memory_hits / lookups if lookups else 0.0,
+            }
+
+    def _load(self, page_num: int):
+        row = self.conn.execute(
+            "SELECT blocks FROM layouts WHERE pdf_hash = ? AND page_num = ?", (self.pdf_hash, page_num)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _remember(self, page_num: int, blocks: list):
+        self.memory[page_num] = blocks
+        self.memory.move_to_end(page_num)
+        while len(self.memory) > self.max_pages:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,28 +1,40 @@
 # @Author: Bi Ying
 # @Date:   2024-07-21 22:54:26
-import re
 import os
 import io
 import json
+import atexit
+import time
+import cProfile
+import threading
 import mimetypes
+import multiprocessing
 import webbrowser
 from pathlib import Path
-from copy import deepcopy
 
 import pymupdf
-from PIL import Image
 from flask import (
     Flask,
+    g,
     abort,
     request,
+    Response,
     jsonify,
+    make_response,
     send_file,
     render_template,
     send_from_directory,
+    stream_with_context,
 )
 
-from vectorvein.settings import settings
-from vectorvein.chat_clients import create_chat_client, BaseChatClient
+from batch import BatchTranslationJob
+from jobs import JobManager
+from metrics import metrics, server_timing, start_request_spans, finish_request_spans
+from preview import IMAGE_MIMETYPES, parse_preview_options
+from sessions import ChatClientPool, DocumentBusyError, TranslatorPool, document_id
+from translation_memory import TranslationMemory
+from translation_store import atomic_write_json
+from translator import PDFTranslator
 
 
 mimetypes.add_type("application/javascript", ".js")
@@ -33,355 +45,123 @@ DEBUG = os.environ.get("PDF_VISUALIZE_TRANSLATE_DEBUG", "0") == "1"
 app = Flask(__name__)
 
 llm_credentials_file = Path("llm_credentials.json")
-if not llm_credentials_file.exists():
-    llm_credentials_file.write_text("{}")
-settings.load(json.loads(llm_credentials_file.read_text()))
-
-translation_extract_re = re.compile(r"<.*?>(.*?)</.*?>", re.DOTALL)
-
 config_file = Path("config.json")
-if not config_file.exists():
-    raise FileNotFoundError("Config file not found")
-config = json.loads(config_file.read_text())
-port = config.get("port", 5000)
-
-
-class PDFTranslator:
-    def __init__(
-        self,
-        pdf_path: str,
-        output_json_path: str,
-        translated_pdf_path: str,
-        font_name: str,
-        font_file: str,
-        target_language: str,
-        model_selection: list,
-    ):
-        self.pdf_path = pdf_path
-        self.output_json_path = output_json_path
-        self.translated_pdf_path = translated_pdf_path
-        self.font_name = font_name
-        self.font_file = font_file
-        self.target_language = target_language
-        self.model_selection = model_selection
-        self.doc = pymupdf.open(pdf_path)
-        self.current_page = 0
-        self.translations = {"pages": [{"page_number": i, "translations": []} for i in range(len(self.doc))]}
-        self.clients = {}
-        provider = model_selection[0].lower() if model_selection else "openai"
-        self.clients[provider] = create_chat_client(provider, stream=False)
-        self.load_progress()
-
-    def load_progress(self):
-        if Path(self.output_json_path).exists():
-            with open(self.output_json_path, "r", encoding="utf-8") as f:
-                self.translations = json.load(f)
-
-    def save_progress(self):
-        with open(self.output_json_path, "w", encoding="utf-8") as f:
-            json.dump(self.translations, f, ensure_ascii=False, indent=4)
-
-    def get_page_info(self, page_num):
-        page = self.doc[page_num]
-        blocks = page.get_text("blocks")
-        valid_blocks = []
-        extra_blocks = deepcopy(self.translations["pages"][page_num]["translations"])
-        for block in blocks:
-            if self.is_valid_text(block[4]):
-                block_info = {
-                    "originalRect": block[:4],
-                    "rect": block[:4],
-                    "text": block[4].strip(),
-                    "font_size": self.get_font_size(page, block),
-                    "color": self.get_text_color(page, block),
-                }
-                # Check if this block has been translated
-                if self.translations["pages"][page_num]["translations"]:
-                    translated_block = next(
-                        (
-                            item
-                            for item in self.translations["pages"][page_num]["translations"]
-                            if item["original"] == block_info["text"]
-                            and tuple(item["rect"]) == tuple(block_info["rect"])
-                        ),
-                        None,
-                    )
-                    if translated_block:
-                        block_info["translation"] = translated_block["translation"]
-                        block_info["translated"] = translated_block["translation"] is not None
-                        block_info["rect"] = translated_block.get("new_rect") or block_info["rect"]
-                        block_info["align"] = translated_block.get("align", pymupdf.TEXT_ALIGN_LEFT)
-                        if block_info.get("font_size") != translated_block.get("font_size"):
-                            block_info["font_size"] = translated_block.get("font_size")
-                        if block_info.get("color") != translated_block.get("color"):
-                            block_info["color"] = translated_block.get("color")
-                        # 从 extra_blocks 中删除这个translated_block
-                        extra_blocks.remove(translated_block)
-                    else:
-                        block_info["translated"] = False
-                else:
-                    block_info["translated"] = False
-                valid_blocks.append(block_info)
-
-        for extra_block in extra_blocks:
-            extra_block["text"] = extra_block["original"]
-            extra_block["translated"] = extra_block["translation"] is not None
-            extra_block["originalRect"] = extra_block["rect"]
-            extra_block["rect"] = extra_block.get("new_rect") or extra_block["rect"]
-            extra_block["align"] = extra_block.get("align", pymupdf.TEXT_ALIGN_LEFT)
-            extra_block["is_extra"] = True
-            valid_blocks.append(extra_block)
-
-        return {"blocks": valid_blocks, "width": page.rect.width, "height": page.rect.height}
-
-    def is_valid_text(self, text):
-        return bool(re.search(r"[a-zA-Z0-9\u4e00-\u9fff]", text))
-
-    def get_font_size(self, page, block):
-        text_instances = page.search_for(block[4].strip())
-        if text_instances:
-            rect = text_instances[0]
-            font_size = rect.y1 - rect.y0
-            return font_size
-        return 12  # Default font size if not found
-
-    def get_text_color(self, page, block):
-        text_instances = page.search_for(block[4].strip())
-        if not text_instances:
-            return (0, 0, 0)
-        rect = text_instances[0]
-        for span in page.get_text("dict")["blocks"]:
-            for line in span.get("lines", []):
-                for span in line["spans"]:
-                    if pymupdf.Rect(span["bbox"]) == rect:
-                        color_int = span["color"]
-                        r = (color_int >> 16) & 0xFF
-                        g = (color_int >> 8) & 0xFF
-                        b = color_int & 0xFF
-                        return (r / 255.0, g / 255.0, b / 255.0)
-        return (0, 0, 0)  # Default color (black)
-
-    def translate_block(self, text: str, model_selection: list | None = None, extra_requirements: str = ""):
-        if model_selection is None:
-            provider = self.model_selection[0].lower()
-            model = self.model_selection[1].lower()
-        else:
-            provider = model_selection[0].lower()
-            model = model_selection[1].lower()
-
-        if provider not in self.clients:
-            self.clients[provider] = create_chat_client(provider, stream=False)
-        client: BaseChatClient = self.clients[provider]
-
-        book_name = Path(self.pdf_path).stem
-        system_prompt = f"你是专业的书籍翻译员，你需要对这本《{book_name}》进行翻译。翻译时务必根据这本书的内容进行翻译，保持信达雅。请根据用户的输入片段直接输出翻译结果，不要解释。"
-        if extra_requirements:
-            system_prompt += f"\n\n额外要求: {extra_requirements}"
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {
-                "role": "user",
-                "content": f"<原文片段>{text}</原文片段>\n\n<要求>目标语言：{self.target_language}\n直接输出翻译结果，不需要用XML标签包裹。</要求>",
-            },
-        ]
-
-        response = client.create_completion(messages=messages, model=model, temperature=0.2)
-        result = response.content
-        if translation_extract_re.match(result):
-            return translation_extract_re.match(result).group(1)
-        else:
-            return result
-
-    def delete_block(self, page_num, rect, original):
-        # Convert rect to a tuple for easy comparison
-        rect_tuple = tuple(rect)
-
-        # Check if the translation already exists for this block on the given page
-        existing_translation = next(
-            (
-                item
-                for item in self.translations["pages"][page_num]["translations"]
-                if tuple(item["rect"]) == rect_tuple and item["original"] == original
-            ),
-            None,
-        )
-
-        if existing_translation:
-            # If a translation already exists, delete the existing record
-            self.translations["pages"][page_num]["translations"].remove(existing_translation)
-            self.save_progress()
 
-    def save_translation(
-        self,
-        page_num,
-        block_index,
-        translation,
-        original,
-        rect,
-        font_size,
-        color,
-        align,
-        new_rect=None,
-    ):
-        # Convert rect to a tuple for easy comparison
-        rect_tuple = tuple(rect)
-
-        # Check if the translation already exists for this block on the given page
-        existing_translation = next(
-            (
-                item
-                for item in self.translations["pages"][page_num]["translations"]
-                if tuple(item["rect"]) == rect_tuple and item["original"] == original
-            ),
-            None,
+# 以下共享状态由 create_app() 创建：导出进程用 spawn 启动时会重新导入本模块，导入时不能加载配置和 LLM SDK
+config: dict = {}
+translation_memory: TranslationMemory | None = None
+jobs: JobManager | None = None
+client_pool: ChatClientPool | None = None
+translators: TranslatorPool | None = None
+batch_jobs: dict[str, BatchTranslationJob] = {}
+# 请求线程会同时登记任务和检查文档是否忙碌，batch_jobs 的读写都要持有这个锁
+batch_jobs_lock = threading.Lock()
+max_finished_batch_jobs = 100
+
+
+def translator_is_busy(translator: PDFTranslator):
+    if jobs.is_busy(translator):
+        return True
+    with batch_jobs_lock:
+        return any(
+            job.translator is translator and job.status in ("pending", "running") for job in batch_jobs.values()
         )
 
-        if existing_translation:
-            # If a translation already exists, update the existing record
-            existing_translation["translation"] = translation
-            existing_translation["original"] = original
-            existing_translation["font_size"] = font_size
-            existing_translation["color"] = color
-            existing_translation["new_rect"] = new_rect if new_rect else rect
-            existing_translation["align"] = align
-        else:
-            # If no translation exists, append a new record
-            self.translations["pages"][page_num]["translations"].append(
-                {
-                    "original": original,
-                    "translation": translation,
-                    "rect": rect,
-                    "new_rect": new_rect if new_rect else rect,
-                    "font_size": font_size,
-                    "color": color,
-                    "align": align,
-                }
-            )
-
-        self.save_progress()
-
-    def _add_textbox(
-        self,
-        page: pymupdf.Page,
-        rect: pymupdf.Rect,
-        text,
-        font_name,
-        font_file,
-        initial_font_size=60,
-        min_font_size=5,
-        color=(0, 0, 0),
-        align: int = pymupdf.TEXT_ALIGN_LEFT,
-    ):
-        font_size = initial_font_size
-        while font_size >= min_font_size:
-            result = page.insert_textbox(
-                rect,
-                text,
-                fontsize=font_size,
-                fontname=font_name,
-                fontfile=font_file,
-                color=color,
-                align=align,
-            )
-            if result >= 0:  # 成功插入文本
-                return font_size
-            font_size -= 0.5  # 减小字体大小并重试
-
-        # 如果达到最小字体大小仍然无法插入，则使用最小字体大小插入
-        # 但是要不断扩大 rect 的宽度以使得能够正常插入
-        delta = rect.x1 - rect.x0
-        inserted = False
-        while not inserted:
-            delta += 1
-            rect = pymupdf.Rect(rect.x0, rect.y0, rect.x0 + delta, rect.y1 + delta)
-            insert_result = page.insert_textbox(
-                rect,
-                text,
-                fontsize=min_font_size,
-                fontname=font_name,
-                fontfile=font_file,
-                color=color,
-                align=align,
-            )
-            inserted = insert_result >= 0
-        return min_font_size
-
-    def generate_translated_pdf(self):
-        for page_num in range(len(self.doc)):
-            page = self.doc.load_page(page_num)
-            page_data = self.translations["pages"][page_num]
-            for translation in page_data["translations"]:
-                block_rect = pymupdf.Rect(*translation["rect"])
-
-                # 使用 add_redact_annot 方法添加涂黑注释
-                page.add_redact_annot(block_rect)
-
-                # 应用涂黑注释来删除原始文本
-                page.apply_redactions(images=0, graphics=0, text=0)
-
-            for translation in page_data["translations"]:
-                rect = translation.get("new_rect") or translation["rect"]
-                block_rect = pymupdf.Rect(*rect)
-
-                # 插入翻译后的文本框
-                self._add_textbox(
-                    page=page,
-                    rect=block_rect,
-                    text=translation["translation"],
-                    font_name=self.font_name,
-                    font_file=self.font_file,
-                    initial_font_size=translation["font_size"],
-                    color=translation.get("color", (0, 0, 0)),
-                    align=translation.get("align", pymupdf.TEXT_ALIGN_LEFT),
-                )
-        self.doc.save(self.translated_pdf_path, garbage=4, deflate=True, clean=True)
-        return f"Translated PDF saved to {self.translated_pdf_path}"
-
-    def preview_page(self, page_num, scale=2.0):
-        # Create a temporary PDF with just the requested page
-        temp_doc = pymupdf.open()
-        temp_doc.insert_pdf(self.doc, from_page=page_num, to_page=page_num)
-        temp_page = temp_doc[0]
-
-        # Apply translations to the temporary page
-        page_data = self.translations["pages"][page_num]
-        for translation in page_data["translations"]:
-            block_rect = pymupdf.Rect(*translation["rect"])
-            temp_page.add_redact_annot(block_rect)
-            temp_page.apply_redactions(images=0, graphics=0, text=0)
-
-        for translation in page_data["translations"]:
-            rect = translation.get("new_rect") or translation["rect"]
-            block_rect = pymupdf.Rect(*rect)
-            self._add_textbox(
-                page=temp_page,
-                rect=block_rect,
-                text=translation["translation"],
-                font_name=self.font_name,
-                font_file=self.font_file,
-                initial_font_size=translation["font_size"],
-                color=translation.get("color", (0, 0, 0)),
-                align=translation.get("align", pymupdf.TEXT_ALIGN_LEFT),
-            )
-
-        # Render the page to an image with increased resolution
-        mat = pymupdf.Matrix(scale, scale)  # Increase scale for higher resolution
-        pix = temp_page.get_pixmap(matrix=mat, alpha=False)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        # Save the image to a byte stream
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format="PNG", dpi=(300, 300))  # Set DPI for better quality
-        img_byte_arr = img_byte_arr.getvalue()
-
-        # Close the temporary document
-        temp_doc.close()
-
-        return img_byte_arr
-
-
-translator = None
+
+def add_batch_job(job: BatchTranslationJob):
+    """
+    Register a batch job and forget the oldest finished ones beyond max_finished_batch_jobs.
+    """
+    with batch_jobs_lock:
+        finished = [other for other in batch_jobs.values() if other.finished_at is not None]
+        for other in sorted(finished, key=lambda other: other.finished_at)[:-max_finished_batch_jobs]:
+            del batch_jobs[other.id]
+        batch_jobs[job.id] = job
+
+
+def get_batch_job(job_id: str):
+    with batch_jobs_lock:
+        return batch_jobs.get(job_id)
+
+
+def create_app():
+    """
+    Load the LLM credentials and config.json, and create the state shared by the routes.
+    """
+    global config, translation_memory, jobs, client_pool, translators
+    from vectorvein.settings import settings
+
+    if not llm_credentials_file.exists():
+        llm_credentials_file.write_text("{}")
+    settings.load(json.loads(llm_credentials_file.read_text()))
+
+    if not config_file.exists():
+        raise FileNotFoundError("Config file not found")
+    config = json.loads(config_file.read_text())
+    translation_memory = TranslationMemory(config.get("translation_memory_path", "translation_memory.db"))
+    jobs = JobManager(max_workers=config.get("job_workers", 2))
+    client_pool = ChatClientPool()
+    translators = TranslatorPool(max_documents=config.get("max_documents", 4), is_busy=translator_is_busy)
+    atexit.register(shutdown)
+    return app
+
+
+def shutdown():
+    """
+    Stop the batch jobs and close every document, so their changes are saved to translations.json.
+    """
+    with batch_jobs_lock:
+        running_jobs = list(batch_jobs.values())
+    for job in running_jobs:
+        job.cancel()
+    for job in running_jobs:
+        # 批量翻译线程是守护线程，等它们停下再关闭文档
+        if job.thread is not None:
+            job.thread.join(timeout=30)
+    translators.close_all()
+
+
+def get_translator(data, require_doc_id=False):
+    """
+    The translator of data["doc_id"]. Without a doc_id, the most recently used document is used,
+    unless require_doc_id: routes that change a document must name it.
+    """
+    doc_id = data.get("doc_id")
+    if require_doc_id and not doc_id:
+        abort(make_response(jsonify({"status": "error", "message": "doc_id is required"}), 400))
+    translator = translators.get(doc_id) if doc_id else translators.latest()
+    if translator is None:
+        message = "Document not found, initialize the translator first"
+        abort(make_response(jsonify({"status": "error", "message": message}), 404))
+    return translator
+
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.spans_token = start_request_spans()
+    # 单个请求的性能分析：在 URL 上加 ?profile=1
+    if request.args.get("profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def add_server_timing(response):
+    total_ms = (time.perf_counter() - g.request_start) * 1000
+    spans = finish_request_spans(g.spans_token)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        profile_dir = Path(config.get("profile_dir", "profiles"))
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = profile_dir / f"{request.endpoint}-{int(time.time() * 1000)}.prof"
+        profiler.dump_stats(profile_path)
+        response.headers["X-Profile-File"] = str(profile_path)
+    if request.path.startswith("/api/"):
+        metrics.observe_request(request.endpoint or request.path, total_ms, response.status_code)
+        response.headers["Server-Timing"] = server_timing(spans, total_ms)
+    return response
 
 
 def get_pdf_folder():
@@ -396,6 +176,11 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+
 @app.route("/api/get_config", methods=["GET"])
 def get_config():
     config_path = "config.json"
@@ -410,14 +195,15 @@ def get_config():
 @app.route("/api/save_config", methods=["POST"])
 def save_config():
     data = request.get_json()
-    with open("config.json", "w", encoding="utf8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    # 合并到现有配置中，前端不认识的设置（translation_storage 等）不会丢失
+    saved_config = json.loads(config_file.read_text(encoding="utf8")) if config_file.exists() else {}
+    saved_config.update(data)
+    atomic_write_json(str(config_file), saved_config, ensure_ascii=False, indent=4)
     return jsonify({"status": "success"})
 
 
 @app.route("/api/init_translator", methods=["POST"])
 def init_translator():
-    global translator
     data = request.get_json()
     pdf_path = data["pdf_path"]
     output_json_path = data["output_json_path"]
@@ -426,6 +212,23 @@ def init_translator():
     font_file = data["font_file"]
     target_language = data["target_language"]
     model_selection = data["model_selection"]
+    doc_id = document_id(pdf_path, output_json_path)
+    translator = translators.get(doc_id)
+    if translator is not None and (
+        translator.translated_pdf_path,
+        translator.font_name,
+        translator.font_file,
+        translator.target_language,
+        translator.model_selection,
+    ) == (translated_pdf_path, font_name, font_file, target_language, model_selection):
+        # 文档已经打开且配置相同，直接复用
+        return jsonify({"status": "success", "doc_id": doc_id})
+    if translator is not None:
+        # 配置变了，先关闭旧实例，它会把日志中的修改压缩保存，新实例再重新加载
+        try:
+            translators.remove(doc_id)
+        except DocumentBusyError as e:
+            return jsonify({"status": "error", "message": str(e)}), 409
     try:
         translator = PDFTranslator(
             pdf_path,
@@ -435,32 +238,160 @@ def init_translator():
             font_file,
             target_language,
             model_selection,
+            translation_memory=translation_memory,
+            client_pool=client_pool,
+            prefetch_radius=int(config.get("prefetch_pages", 2)),
+            translation_storage=config.get("translation_storage", "json"),
+            translation_cache_pages=int(config.get("translation_cache_pages", 64)),
         )
-        return jsonify({"status": "success"})
+        translators.put(doc_id, translator)
+        if data.get("warm_up", config.get("layout_warm_up", False)):
+            translator.prefetcher.warm_up()
+        return jsonify({"status": "success", "doc_id": doc_id})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 
+@app.route("/api/documents", methods=["GET"])
+def documents():
+    return jsonify(
+        {
+            "documents": [
+                {"doc_id": doc_id, "pdf_path": translator.pdf_path, "output_json_path": translator.output_json_path}
+                for doc_id, translator in translators.items()
+            ]
+        }
+    )
+
+
+@app.route("/api/close_document", methods=["POST"])
+def close_document():
+    data = request.get_json()
+    try:
+        removed = translators.remove(data["doc_id"])
+    except DocumentBusyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    if not removed:
+        return jsonify({"status": "error", "message": "Document not found"}), 404
+    return jsonify({"status": "success"})
+
+
 @app.route("/api/get_page_info", methods=["POST"])
 def get_page_info():
     data = request.get_json()
+    translator = get_translator(data)
     page_num = int(data["page_num"])
     return jsonify(translator.get_page_info(page_num))
 
 
+@app.route("/api/page_cache_stats", methods=["GET"])
+def page_cache_stats():
+    return jsonify(get_translator(request.args).page_cache_stats())
+
+
 @app.route("/api/translate_block", methods=["POST"])
 def translate_block():
     data = request.get_json()
+    translator = get_translator(data)
     text = data["text"]
     model_selection = data["model_selection"]
     extra_requirements = data.get("extra_requirements", "")
-    translation = translator.translate_block(text, model_selection, extra_requirements)
+    # refresh：不使用翻译记忆，重新请求模型
+    use_memory = not data.get("refresh", False)
+    translation = translator.translate_block(text, model_selection, extra_requirements, use_memory)
     return jsonify({"translation": translation})
 
 
+@app.route("/api/translate_block_stream", methods=["POST"])
+def translate_block_stream():
+    data = request.get_json()
+    translator = get_translator(data)
+    text = data["text"]
+    model_selection = data["model_selection"]
+    extra_requirements = data.get("extra_requirements", "")
+    use_memory = not data.get("refresh", False)
+
+    def generate():
+        try:
+            for event, content in translator.translate_block_stream(
+                text, model_selection, extra_requirements, use_memory
+            ):
+                payload = {"content": content} if event == "delta" else {"translation": content}
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)}, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/translation_memory_stats", methods=["GET"])
+def translation_memory_stats():
+    return jsonify(translation_memory.stats())
+
+
+@app.route("/api/translation_memory_suggest", methods=["POST"])
+def translation_memory_suggest():
+    data = request.get_json()
+    target_language = data.get("target_language") or get_translator(data).target_language
+    suggestions = translation_memory.suggest(data["text"], target_language)
+    return jsonify({"suggestions": suggestions})
+
+
+@app.route("/api/batch_translate", methods=["POST"])
+def batch_translate():
+    data = request.get_json()
+    translator = get_translator(data, require_doc_id=True)
+    model_selection = data.get("model_selection") or translator.model_selection
+    provider = model_selection[0].lower()
+    job = BatchTranslationJob(
+        translator,
+        model_selection=model_selection,
+        extra_requirements=data.get("extra_requirements", ""),
+        start_page=int(data.get("start_page", 0)),
+        end_page=int(data["end_page"]) if data.get("end_page") is not None else None,
+        concurrency=int(data.get("concurrency", 4)),
+        rpm=int(data.get("rpm", config.get("rate_limits", {}).get(provider, 0))),
+        max_retries=int(data.get("max_retries", 3)),
+        pack_token_budget=int(data.get("pack_token_budget", config.get("pack_token_budget", 0))),
+    )
+    # 先登记再启动：登记后文档就算忙碌，不会被关闭或换出
+    add_batch_job(job)
+    if translators.get(data["doc_id"]) is not translator:
+        # 文档在 get_translator 之后、登记之前被关闭了
+        with batch_jobs_lock:
+            del batch_jobs[job.id]
+        return jsonify({"status": "error", "message": "Document was closed, initialize the translator again"}), 409
+    job.start()
+    return jsonify({"status": "success", "job_id": job.id})
+
+
+@app.route("/api/batch_status", methods=["POST"])
+def batch_status():
+    data = request.get_json()
+    job = get_batch_job(data["job_id"])
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job.progress())
+
+
+@app.route("/api/batch_cancel", methods=["POST"])
+def batch_cancel():
+    data = request.get_json()
+    job = get_batch_job(data["job_id"])
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    job.cancel()
+    return jsonify({"status": "success"})
+
+
 @app.route("/api/delete_block", methods=["POST"])
 def delete_block():
     data = request.get_json()
+    translator = get_translator(data, require_doc_id=True)
     page_num = int(data["page_num"])
     rect = data["rect"]
     original = data["original"]
@@ -471,6 +402,7 @@ def delete_block():
 @app.route("/api/save_translation", methods=["POST"])
 def save_translation():
     data = request.get_json()
+    translator = get_translator(data, require_doc_id=True)
     page_num = int(data["page_num"])
     block_index = int(data["block_index"])
     translation = data["translation"]
@@ -490,29 +422,68 @@ def save_translation():
         color,
         align,
         new_rect,
+        remember=True,
     )
     return jsonify({"status": "success"})
 
 
 @app.route("/api/finish_translation", methods=["POST"])
 def finish_translation():
-    result = translator.generate_translated_pdf()
+    data = request.get_json(silent=True) or {}
+    translator = get_translator(data, require_doc_id=True)
+    options = {
+        "workers": int(data.get("workers", config.get("export_workers", 1))),
+        "incremental": bool(data.get("incremental", config.get("incremental_export", False))),
+        "fast_save": bool(data.get("fast_save", config.get("fast_save", False))),
+        "merge_redactions": bool(data.get("merge_redactions", config.get("merge_redactions", False))),
+    }
+    if data.get("background"):
+        # 导出耗时较长，后台执行，前端通过 /api/job_status 轮询结果
+        job = jobs.submit("finish_translation", translator.generate_translated_pdf, owner=translator, **options)
+        return jsonify({"status": "success", "job_id": job.id})
+    result = translator.generate_translated_pdf(**options)
     return jsonify({"status": "success", "message": result})
 
 
-@app.route("/api/preview", methods=["POST"])
-def preview_page():
+@app.route("/api/job_status", methods=["POST"])
+def job_status():
     data = request.get_json()
+    job = jobs.get(data["job_id"])
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/preview", methods=["GET", "POST"])
+def preview_page():
+    data = request.get_json() if request.method == "POST" else request.args
+    translator = get_translator(data)
     page_num = int(data["page_num"])
+    try:
+        scale, image_format, quality, clip = parse_preview_options(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    img_byte_arr = translator.preview_page(page_num)
+    etag = translator.get_preview_etag(page_num, scale, image_format, quality, clip)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        img_byte_arr = translator.preview_page(page_num, scale, image_format, quality, clip)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    return send_file(
+    response = send_file(
         io.BytesIO(img_byte_arr),
-        mimetype="image/png",
+        mimetype=IMAGE_MIMETYPES[image_format],
         as_attachment=True,
-        download_name=f"preview_page_{page_num}.png",
+        download_name=f"preview_page_{page_num}.{image_format}",
+        etag=etag,
     )
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.route("/pdf/<path:filename>")
@@ -525,5 +496,14 @@ def serve_pdf(filename):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    create_app()
+    port = config.get("port", 5000)
     webbrowser.open(f"http://127.0.0.1:{port}")
-    app.run(debug=DEBUG, port=port)
+    if DEBUG:
+        app.run(debug=DEBUG, port=port, threaded=True)
+    else:
+        from waitress import serve
+
+        # waitress 用线程池处理请求，翻译和导出请求不会阻塞页面信息与预览请求
+        serve(app, host="127.0.0.1", port=port, threads=int(config.get("server_threads", 8)))
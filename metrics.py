@@ -0,0 +1,200 @@
+import time
+import bisect
+import threading
+from contextvars import ContextVar
+
+from packing import estimate_tokens
+
+
+# 直方图桶的上界，单位毫秒
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float):
+        """
+        Upper bound of the bucket holding the q-quantile, or the maximum for the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = []
+        for bound, count in zip((*BUCKETS_MS, "+Inf"), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": round(self.quantile(0.5), 3),
+            "p95_ms": round(self.quantile(0.95), 3),
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    """
+    Process-wide latency histograms of spans, API requests and LLM calls, plus token counts.
+    """
+
+    def __init__(self):
+        self.spans: dict[str, Histogram] = {}
+        self.requests: dict[str, Histogram] = {}
+        self.request_errors: dict[str, int] = {}
+        self.llm: dict[tuple[str, str], dict] = {}
+        self.lock = threading.Lock()
+
+    def observe_span(self, name: str, ms: float):
+        with self.lock:
+            self.spans.setdefault(name, Histogram()).observe(ms)
+
+    def observe_request(self, endpoint: str, ms: float, status_code: int):
+        with self.lock:
+            self.requests.setdefault(endpoint, Histogram()).observe(ms)
+            if status_code >= 500:
+                self.request_errors[endpoint] = self.request_errors.get(endpoint, 0) + 1
+
+    def _llm_entry(self, provider: str, model: str):
+        return self.llm.setdefault(
+            (provider, model),
+            {
+                "requests": 0,
+                "errors": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "latency": Histogram(),
+                "first_token": Histogram(),
+            },
+        )
+
+    def observe_llm(
+        self,
+        provider: str,
+        model: str,
+        ms: float,
+        prompt_tokens: int,
+        completion_tokens: int,
+        first_token_ms: float | None = None,
+    ):
+        with self.lock:
+            entry = self._llm_entry(provider, model)
+            entry["requests"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["latency"].observe(ms)
+            if first_token_ms is not None:
+                entry["first_token"].observe(first_token_ms)
+
+    def observe_llm_error(self, provider: str, model: str):
+        with self.lock:
+            self._llm_entry(provider, model)["errors"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "spans": {name: histogram.to_dict() for name, histogram in self.spans.items()},
+                "requests": {
+                    endpoint: {**histogram.to_dict(), "errors": self.request_errors.get(endpoint, 0)}
+                    for endpoint, histogram in self.requests.items()
+                },
+                "llm": [
+                    {
+                        "provider": provider,
+                        "model": model,
+                        "requests": entry["requests"],
+                        "errors": entry["errors"],
+                        "prompt_tokens": entry["prompt_tokens"],
+                        "completion_tokens": entry["completion_tokens"],
+                        "latency": entry["latency"].to_dict(),
+                        "first_token": entry["first_token"].to_dict(),
+                    }
+                    for (provider, model), entry in self.llm.items()
+                ],
+            }
+
+
+metrics = Metrics()
+
+# 当前请求记录的 span 列表，不在请求中（后台任务、预取线程）时为 None
+request_spans: ContextVar[list | None] = ContextVar("request_spans", default=None)
+
+
+class span:
+    """
+    Time a stage: `with span("extract_layout"):`. The duration goes into the span histogram and,
+    inside an API request, into its Server-Timing header. The elapsed time is kept in .ms.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ms = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.ms = (time.perf_counter() - self.start) * 1000
+        metrics.observe_span(self.name, self.ms)
+        spans = request_spans.get()
+        if spans is not None:
+            spans.append((self.name, self.ms))
+        return False
+
+
+def start_request_spans():
+    return request_spans.set([])
+
+
+def finish_request_spans(token):
+    spans = request_spans.get() or []
+    request_spans.reset(token)
+    return spans
+
+
+def server_timing(spans: list, total_ms: float):
+    """
+    Server-Timing header value, with repeated spans of the same name summed up.
+    """
+    totals = {}
+    counts = {}
+    for name, ms in spans:
+        totals[name] = totals.get(name, 0.0) + ms
+        counts[name] = counts.get(name, 0) + 1
+    entries = [
+        f'{name};desc="{counts[name]}x";dur={ms:.1f}' if counts[name] > 1 else f"{name};dur={ms:.1f}"
+        for name, ms in totals.items()
+    ]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+def usage_tokens(usage, messages: list, content: str):
+    """
+    Prompt and completion tokens from the provider's usage, estimated when it isn't reported.
+    """
+    if usage is not None and usage.prompt_tokens is not None:
+        return usage.prompt_tokens, usage.completion_tokens or 0
+    return sum(estimate_tokens(message["content"]) for message in messages), estimate_tokens(content or "")
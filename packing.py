@@ -0,0 +1,78 @@
+import re
+
+
+SEGMENT_OVERHEAD_TOKENS = 12
+
+cjk_re = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+segment_tag_re = re.compile(r"<\s*(/?)\s*译文片段(?:\s+id\s*=\s*[\"']?(\d+)[\"']?)?\s*>")
+
+
+def estimate_tokens(text: str):
+    """
+    Rough token estimate without a tokenizer:
+    one token per CJK character, four characters per token otherwise.
+    """
+    cjk_count = len(cjk_re.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def pack_texts(texts: list[str], token_budget: int, max_segments: int = 20):
+    """
+    Greedily group consecutive texts so that each group stays under token_budget.
+
+    Returns a list of index lists. A text larger than the budget gets a group of its own.
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text) + SEGMENT_OVERHEAD_TOKENS
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_segments):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_packed_content(texts: list[str], target_language: str):
+    segments = "\n".join(
+        f'<原文片段 id="{number}">{text}</原文片段>' for number, text in enumerate(texts, start=1)
+    )
+    return (
+        f"{segments}\n\n<要求>目标语言：{target_language}\n"
+        '逐段翻译，每段译文用编号相同的 <译文片段 id="编号"></译文片段> 标签包裹，'
+        "段数和编号必须与原文一致，不要合并、拆分或遗漏段落，不要输出其他内容。</要求>"
+    )
+
+
+def parse_packed_result(result: str, count: int):
+    """
+    Parse <译文片段 id="n">...</译文片段> segments from a packed completion.
+
+    Returns the translations in id order, or None when the segments can't be matched
+    one-to-one with the count source texts, so the caller can fall back to single-block requests.
+    """
+    translations = {}
+    open_tag = None
+    for match in segment_tag_re.finditer(result):
+        is_close, number = match.group(1), match.group(2)
+        if not is_close:
+            if open_tag is not None or number is None:
+                return None
+            open_tag = match
+        else:
+            if open_tag is None:
+                return None
+            number = int(open_tag.group(2))
+            if number in translations:
+                return None
+            translations[number] = result[open_tag.end() : match.start()].strip()
+            open_tag = None
+
+    if open_tag is not None or sorted(translations) != list(range(1, count + 1)):
+        return None
+    return [translations[number] for number in range(1, count + 1)]
@@ -0,0 +1,78 @@
+import queue
+import threading
+import itertools
+
+
+NEIGHBOUR_PRIORITY = 0
+WARM_UP_PRIORITY = 1
+
+
+class PagePrefetcher:
+    """
+    Extracts page layouts on a background thread before they are requested.
+
+    After each page request the next and previous radius pages are queued; warm_up() queues
+    every page of the document at a lower priority, so page turns are always served first.
+    load_page(page_num, remember) does the work, remember tells whether the page should be
+    kept in memory (neighbours) or only persisted (warm-up).
+    """
+
+    def __init__(self, load_page, page_count: int, radius: int = 2):
+        self.load_page = load_page
+        self.page_count = page_count
+        self.radius = radius
+        self.queue = queue.PriorityQueue()
+        self.pending = set()
+        self.counter = itertools.count()
+        self.prefetched = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+
+    def request(self, page_num: int):
+        # 离当前页越近越先处理
+        for distance in range(1, self.radius + 1):
+            for neighbour in (page_num + distance, page_num - distance):
+                if 0 <= neighbour < self.page_count:
+                    self._enqueue(NEIGHBOUR_PRIORITY, neighbour)
+
+    def warm_up(self):
+        for page_num in range(self.page_count):
+            self._enqueue(WARM_UP_PRIORITY, page_num)
+
+    def _enqueue(self, priority: int, page_num: int):
+        with self.lock:
+            if self.closed or (priority, page_num) in self.pending:
+                return
+            self.pending.add((priority, page_num))
+            self.queue.put((priority, next(self.counter), page_num))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="page-prefetch", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            priority, _, page_num = self.queue.get()
+            if page_num is None:
+                return
+            with self.lock:
+                self.pending.discard((priority, page_num))
+            try:
+                if self.load_page(page_num, remember=priority == NEIGHBOUR_PRIORITY):
+                    self.prefetched += 1
+            except Exception:
+                self.errors += 1
+
+    def stats(self):
+        with self.lock:
+            return {"queued": len(self.pending), "prefetched": self.prefetched, "errors": self.errors}
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            thread = self.thread
+        if thread is not None:
+            # 排在所有页面之前，正在处理的页面完成后线程即退出
+            self.queue.put((-1, -1, None))
+            thread.join()
@@ -0,0 +1,229 @@
+import io
+import threading
+from collections import OrderedDict
+
+import pymupdf
+
+from fonts import DocumentFont
+from render import fit_textbox, merge_rects, render_page_translations
+from translation_store import record_key
+
+
+IMAGE_MIMETYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+MIN_SCALE = 0.1
+MAX_SCALE = 8.0
+
+
+def parse_preview_options(data):
+    """
+    Validate the preview parameters of a request: scale, format, quality and an optional clip
+    rectangle in page coordinates, given as [x0, y0, x1, y1] or "x0,y0,x1,y1".
+    Raises ValueError for invalid values.
+    """
+    scale = float(data.get("scale", 2.0))
+    if not MIN_SCALE <= scale <= MAX_SCALE:
+        raise ValueError(f"scale must be between {MIN_SCALE} and {MAX_SCALE}")
+    image_format = str(data.get("format", "png")).lower()
+    image_format = "jpeg" if image_format == "jpg" else image_format
+    if image_format not in IMAGE_MIMETYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    quality = int(data.get("quality", 80))
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    clip = data.get("clip")
+    if clip:
+        clip = [float(value) for value in (clip.split(",") if isinstance(clip, str) else clip)]
+        if len(clip) != 4:
+            raise ValueError("clip must be x0,y0,x1,y1")
+        clip = tuple(clip)
+    return scale, image_format, quality, clip or None
+
+
+def encode_pixmap(pix: pymupdf.Pixmap, image_format: str = "png", quality: int = 80):
+    """
+    Encode an RGB pixmap without copying its samples: PNG and JPEG are encoded by MuPDF,
+    WebP by Pillow reading the pixmap memory directly.
+    """
+    if image_format == "webp":
+        from PIL import Image
+
+        image = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
+        buffer = io.BytesIO()
+        # method=0 是最快的压缩档，预览图不值得更慢的编码
+        image.save(buffer, format="WEBP", quality=quality, method=0)
+        return buffer.getvalue()
+    return pix.tobytes(image_format, jpg_quality=quality)
+
+
+class PreviewCache:
+    """
+    LRU cache of rendered preview images, bounded by the total size of the cached images.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def pop(self, key):
+        with self.lock:
+            image = self.images.pop(key, None)
+            if image is not None:
+                self.total_bytes -= self.size_of(image)
+            return image
+
+    def size_of(self, image):
+        return len(image)
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.total_bytes = 0
+
+    def put(self, key, image):
+        if self.size_of(image) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.images.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= self.size_of(previous)
+            self.images[key] = image
+            self.total_bytes += self.size_of(image)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.total_bytes -= self.size_of(evicted)
+
+
+class PageRaster:
+    """
+    A rasterized translated page, with the records it was rendered from and the page area
+    each record affects (its redaction and its inserted text).
+    """
+
+    def __init__(self, pixmap: pymupdf.Pixmap, records: dict, extents: dict):
+        self.pixmap = pixmap
+        self.records = records
+        self.extents = extents
+
+
+class RasterCache(PreviewCache):
+    """
+    LRU of PageRaster by (page_num, scale), bounded by the pixmap sizes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def size_of(self, raster: PageRaster):
+        return raster.pixmap.size
+
+
+def record_extent(page: pymupdf.Page, record: dict, font_name: str):
+    """
+    Page area whose pixels depend on record: the redaction of the original text and the
+    translation as add_textbox would insert it, padded for glyphs crossing the rects.
+    """
+    rect = pymupdf.Rect(*(record.get("new_rect") or record["rect"]))
+    box, font_size = fit_textbox(
+        page,
+        rect,
+        record["translation"],
+        font_name,
+        None,
+        record["font_size"],
+        color=record.get("color", (0, 0, 0)),
+        align=record.get("align", pymupdf.TEXT_ALIGN_LEFT),
+    )
+    return textbox_extent(page, record, box, font_size)
+
+
+def textbox_extent(page: pymupdf.Page, record: dict, box: pymupdf.Rect | None, font_size: float):
+    rect = pymupdf.Rect(*(record.get("new_rect") or record["rect"]))
+    if box is None:
+        # insert_text 从左上角写入，范围无法预知，取到页面右下角
+        box = pymupdf.Rect(rect.x0, rect.y0, page.rect.x1, page.rect.y1)
+    # 被删除的原文字符可能跨出 redact 区域，按字号留出余量
+    padding = max(font_size, record["font_size"] or 0, 10)
+    extent = box | pymupdf.Rect(*record["rect"])
+    return pymupdf.Rect(extent.x0 - padding, extent.y0 - padding, extent.x1 + padding, extent.y1 + padding)
+
+
+def render_page_raster(
+    source_doc: pymupdf.Document,
+    page_num: int,
+    scale: float,
+    page_translations: list,
+    font_name: str,
+    font_file: str,
+    previous: PageRaster | None = None,
+):
+    """
+    Rasterize page page_num of source_doc with its translations.
+
+    With the previous raster of the same page and scale, only the areas of records that were
+    added, changed or removed since are rendered again, with get_pixmap(clip=...), and copied
+    into it. Records outside those areas don't affect their pixels and are left out.
+    The caller holds render.pymupdf_lock.
+    """
+    records = {record_key(record["rect"], record["original"]): record for record in page_translations}
+    changed = [
+        key
+        for key in records.keys() | (previous.records.keys() if previous else set())
+        if previous is None or records.get(key) != previous.records.get(key)
+    ]
+    if previous is not None and not changed:
+        return previous
+
+    with pymupdf.open() as temp_doc:
+        temp_doc.insert_pdf(source_doc, from_page=page_num, to_page=page_num)
+        page = temp_doc[0]
+        font = DocumentFont(font_name, font_file)
+        matrix = pymupdf.Matrix(scale, scale)
+
+        if previous is None:
+            fitted = render_page_translations(page, page_translations, font)
+            extents = {
+                record_key(record["rect"], record["original"]): textbox_extent(page, record, box, font_size)
+                for record, (box, font_size) in zip(page_translations, fitted)
+            }
+            pixmap = page.get_pixmap(matrix=matrix, alpha=False)
+        else:
+            # 试排版放在单独的页面上：apply_redactions 会清理 page 上未使用的字体资源
+            scratch = temp_doc.new_page(width=page.rect.width, height=page.rect.height)
+            scratch_font_name = font.prepare(scratch)
+            # 新增页面后原来的 Page 对象失效，需要重新加载
+            page = temp_doc[0]
+            extents = dict(previous.extents)
+            dirty = []
+            for key in changed:
+                if key in extents:
+                    dirty.append(extents.pop(key))
+                if key in records:
+                    extents[key] = record_extent(scratch, records[key], scratch_font_name)
+                    dirty.append(extents[key])
+            dirty = merge_rects(dirty)
+            # 与脏区域相交的记录都要重画，它们的 redact 和文本都会影响这些区域的像素
+            affected = [
+                record for key, record in records.items() if any(extents[key].intersects(rect) for rect in dirty)
+            ]
+            redact_rects = None
+            if any(page_font[4] == font.resource_name for page_font in page.get_fonts()):
+                # 原文字体与译文字体同名（例如 helv）：完整渲染涂掉全部原文后 apply_redactions 会删掉原文字体，
+                # 它会影响 fit_textbox 的排版结果，所以这里也要涂掉所有记录的原文
+                redact_rects = [pymupdf.Rect(*record["rect"]) for record in records.values()]
+            render_page_translations(page, affected, font, redact_rects=redact_rects)
+            pixmap = previous.pixmap
+            for rect in dirty:
+                rect &= page.rect
+                if not rect.is_empty:
+                    tile = page.get_pixmap(matrix=matrix, clip=rect, alpha=False)
+                    pixmap.copy(tile, tile.irect)
+    return PageRaster(pixmap, {key: dict(record) for key, record in records.items()}, extents)
@@ -0,0 +1,198 @@
+import threading
+
+import pymupdf
+
+from fonts import DocumentFont
+from metrics import span
+
+
+MAX_EXPAND = 2**16
+
+# MuPDF 不支持多线程并发调用（即使是不同的文档），服务端线程里所有 pymupdf 操作都要持有这个锁
+pymupdf_lock = threading.RLock()
+
+
+def textbox_fits(page: pymupdf.Page, rect: pymupdf.Rect, text, font_size, **kwargs):
+    """
+    Dry run of page.insert_textbox: the shape is never committed, so nothing is written to the page.
+    """
+    return page.new_shape().insert_textbox(rect, text, fontsize=font_size, **kwargs) >= 0
+
+
+def fit_textbox(
+    page: pymupdf.Page,
+    rect: pymupdf.Rect,
+    text,
+    font_name,
+    font_file,
+    initial_font_size=60,
+    min_font_size=5,
+    color=(0, 0, 0),
+    align: int = pymupdf.TEXT_ALIGN_LEFT,
+):
+    """
+    Find the largest font size that fits rect, trying sizes from initial_font_size down to
+    min_font_size in 0.5pt steps. The steps are binary searched with dry runs, so only
+    O(log n) layouts are computed.
+
+    Returns (rect, font_size) for insert_textbox. When the text doesn't fit even at
+    min_font_size, rect is grown to the right and bottom, and when that fails too, rect is None
+    and the text should be written with insert_text from the top left corner.
+    """
+    options = dict(fontname=font_name, fontfile=font_file, color=color, align=align)
+
+    # 找到能放下文本的最大字号：initial_font_size - 0.5 * step
+    max_step = int((initial_font_size - min_font_size) / 0.5) if initial_font_size >= min_font_size else -1
+    if max_step >= 0 and textbox_fits(page, rect, text, initial_font_size, **options):
+        low = high = 0
+    else:
+        low, high = 1, max_step + 1
+    while low < high:
+        middle = (low + high) // 2
+        if textbox_fits(page, rect, text, initial_font_size - 0.5 * middle, **options):
+            high = middle
+        else:
+            low = middle + 1
+    if low <= max_step:
+        return rect, initial_font_size - 0.5 * low
+
+    # 如果达到最小字体大小仍然无法插入，则使用最小字体大小插入
+    # 但是要扩大 rect 以使得能够正常插入：先倍增找到上界，再二分找到最小的扩展量
+    def expanded(expand):
+        return pymupdf.Rect(rect.x0, rect.y0, rect.x1 + expand, rect.y1 + expand)
+
+    expand = 1
+    while expand < MAX_EXPAND and not textbox_fits(page, expanded(expand), text, min_font_size, **options):
+        expand *= 2
+    if not textbox_fits(page, expanded(expand), text, min_font_size, **options):
+        return None, min_font_size
+    low, high = expand // 2 + 1, expand
+    while low < high:
+        middle = (low + high) // 2
+        if textbox_fits(page, expanded(middle), text, min_font_size, **options):
+            high = middle
+        else:
+            low = middle + 1
+    return expanded(low), min_font_size
+
+
+def add_textbox(
+    page: pymupdf.Page,
+    rect: pymupdf.Rect,
+    text,
+    font_name,
+    font_file,
+    initial_font_size=60,
+    min_font_size=5,
+    color=(0, 0, 0),
+    align: int = pymupdf.TEXT_ALIGN_LEFT,
+):
+    """
+    Insert text with the largest font size that fits rect (see fit_textbox), returns the font size.
+    """
+    box, font_size = fit_textbox(page, rect, text, font_name, font_file, initial_font_size, min_font_size, color, align)
+    insert_fitted_textbox(page, rect, box, text, font_name, font_file, font_size, color, align)
+    return font_size
+
+
+def insert_fitted_textbox(
+    page: pymupdf.Page,
+    rect: pymupdf.Rect,
+    box: pymupdf.Rect | None,
+    text,
+    font_name,
+    font_file,
+    font_size,
+    color=(0, 0, 0),
+    align: int = pymupdf.TEXT_ALIGN_LEFT,
+):
+    if box is None:
+        # 仍然放不下时直接从 rect 左上角写入，避免丢失文本
+        page.insert_text(
+            rect.tl + (0, font_size),
+            text,
+            fontsize=font_size,
+            fontname=font_name,
+            fontfile=font_file,
+            color=color,
+        )
+    else:
+        page.insert_textbox(
+            box, text, fontsize=font_size, fontname=font_name, fontfile=font_file, color=color, align=align
+        )
+
+
+def merge_rects(rects: list):
+    """
+    Merge overlapping rects into their bounding rects until no two of them overlap.
+    """
+    merged = []
+    for rect in sorted(rects, key=lambda rect: (rect.y0, rect.x0)):
+        rect = pymupdf.Rect(rect)
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if other.intersects(rect):
+                    merged.remove(other)
+                    rect |= other
+                    changed = True
+                    break
+        merged.append(rect)
+    return merged
+
+
+def redact_page(page: pymupdf.Page, rects: list, merge: bool = False):
+    """
+    Add one redaction annotation per rect and apply them all in a single pass,
+    so the page content stream is rewritten once instead of once per block.
+    With merge, overlapping rects are replaced by their bounding rects first: fewer annotations,
+    but text that lies inside a bounding rect and outside both original rects is removed too.
+    """
+    if merge:
+        rects = merge_rects(rects)
+    for rect in rects:
+        # 使用 add_redact_annot 方法添加涂黑注释
+        page.add_redact_annot(rect)
+    if rects:
+        # 应用涂黑注释来删除原始文本
+        page.apply_redactions(images=0, graphics=0, text=0)
+
+
+def render_page_translations(
+    page: pymupdf.Page,
+    page_translations: list,
+    font: DocumentFont,
+    merge_redactions: bool = False,
+    redact_rects: list | None = None,
+):
+    """
+    Redact the original text of every translated block and insert the translations.
+    redact_rects replaces the rects to redact, when only some of the page's translations
+    are drawn again. Returns the (box, font_size) fit_textbox chose for each translation.
+    """
+    if redact_rects is None:
+        redact_rects = [pymupdf.Rect(*translation["rect"]) for translation in page_translations]
+    with span("redact"):
+        redact_page(page, redact_rects, merge=merge_redactions)
+    if page_translations:
+        font_name = font.prepare(page)
+
+    fitted = []
+    for translation in page_translations:
+        rect = translation.get("new_rect") or translation["rect"]
+        block_rect = pymupdf.Rect(*rect)
+
+        color = translation.get("color", (0, 0, 0))
+        align = translation.get("align", pymupdf.TEXT_ALIGN_LEFT)
+
+        # 插入翻译后的文本框
+        with span("fit_text"):
+            box, font_size = fit_textbox(
+                page, block_rect, translation["translation"], font_name, None, translation["font_size"], 5, color, align
+            )
+            insert_fitted_textbox(
+                page, block_rect, box, translation["translation"], font_name, None, font_size, color, align
+            )
+        fitted.append((box, font_size))
+    return fitted
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from vectorvein.chat_clients import BaseChatClient
+
+
+def create_chat_client(provider: str, stream: bool = False):
+    # vectorvein 导入要好几秒，只在第一次真正需要 LLM 客户端时导入
+    from vectorvein.chat_clients import create_chat_client
+
+    return create_chat_client(provider, stream=stream)
+
+
+def document_id(pdf_path: str, output_json_path: str):
+    """
+    Stable id of a document session: the same PDF and progress file always get the same id.
+    """
+    raw = f"{Path(pdf_path).resolve()}\x1f{Path(output_json_path).resolve()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ChatClientPool:
+    """
+    LLM clients shared by every open document, one per provider and streaming mode.
+    create_client defaults to vectorvein's create_chat_client, benchmarks pass a fake.
+    """
+
+    def __init__(self, create_client=create_chat_client):
+        self.create_client = create_client
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, provider: str, stream: bool = False):
+        with self.lock:
+            key = (provider, stream)
+            if key not in self.clients:
+                self.clients[key] = self.create_client(provider, stream=stream)
+            client: "BaseChatClient" = self.clients[key]
+        return client
+
+
+class DocumentBusyError(Exception):
+    pass
+
+
+class TranslatorPool:
+    """
+    Open PDFTranslator instances by document id.
+
+    When more than max_documents are open, the least recently used documents are closed,
+    except those is_busy(translator) reports as still in use (running batch or export jobs).
+    """
+
+    def __init__(self, max_documents: int = 4, is_busy=None):
+        self.max_documents = max_documents
+        self.is_busy = is_busy or (lambda translator: False)
+        self.translators = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, doc_id: str):
+        with self.lock:
+            translator = self.translators.get(doc_id)
+            if translator is not None:
+                self.translators.move_to_end(doc_id)
+            return translator
+
+    def latest(self):
+        with self.lock:
+            if not self.translators:
+                return None
+            return next(reversed(self.translators.values()))
+
+    def items(self):
+        with self.lock:
+            return list(self.translators.items())
+
+    def put(self, doc_id: str, translator):
+        with self.lock:
+            previous = self.translators.pop(doc_id, None)
+            self.translators[doc_id] = translator
+            evicted = [previous] if previous is not None and previous is not translator else []
+            evicted += self._evict()
+        # 关闭文档会压缩保存进度，放在锁外面执行
+        for evicted_translator in evicted:
+            evicted_translator.close()
+
+    def remove(self, doc_id: str):
+        """
+        Close the document. Raises DocumentBusyError while is_busy(translator) reports it in use.
+        """
+        with self.lock:
+            translator = self.translators.get(doc_id)
+            if translator is not None and self.is_busy(translator):
+                raise DocumentBusyError(f"Document {doc_id} has running jobs")
+            self.translators.pop(doc_id, None)
+        if translator is not None:
+            translator.close()
+        return translator is not None
+
+    def close_all(self):
+        with self.lock:
+            translators = list(self.translators.values())
+            self.translators.clear()
+        for translator in translators:
+            translator.close()
+
+    def _evict(self):
+        evicted = []
+        for doc_id, translator in list(self.translators.items())[:-1]:
+            if len(self.translators) <= self.max_documents:
+                break
+            if not self.is_busy(translator):
+                evicted.append(self.translators.pop(doc_id))
+        return evicted
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmark import FakeChatClient, make_synthetic_pdf
+from sessions import ChatClientPool
+from translator import PDFTranslator
+
+
+@pytest.fixture
+def make_translator(tmp_path):
+    """
+    Open a PDFTranslator on a small synthetic PDF. The LLM is a FakeChatClient, or an instance
+    of client_class when given.
+    """
+    translators = []
+
+    def make(client_class=FakeChatClient, page_count=2, blocks_per_page=12, **kwargs):
+        pdf_path = tmp_path / "book.pdf"
+        if not pdf_path.exists():
+            make_synthetic_pdf(str(pdf_path), page_count=page_count, blocks_per_page=blocks_per_page)
+        client_pool = ChatClientPool(create_client=lambda provider, stream=False: client_class(stream=stream))
+        translator = PDFTranslator(
+            str(pdf_path),
+            str(tmp_path / "translations.json"),
+            str(tmp_path / "translated.pdf"),
+            "helv",
+            None,
+            "中文",
+            ["openai", "gpt-4o-mini"],
+            client_pool=client_pool,
+            prefetch_radius=0,
+            **kwargs,
+        )
+        translators.append(translator)
+        return translator
+
+    yield make
+    for translator in translators:
+        translator.close()
+
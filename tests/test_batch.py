@@ -0,0 +1,178 @@
+import time
+import threading
+
+from batch import BatchTranslationJob, RateLimiter
+from benchmark import FakeChatClient
+
+
+def llm_requests(translator):
+    return sum(client.requests for client in translator.client_pool.clients.values())
+
+
+def untranslated_blocks(translator):
+    return sum(
+        not block["translated"] and not block.get("is_extra")
+        for page_num in range(len(translator.doc))
+        for block in translator.get_page_info(page_num)["blocks"]
+    )
+
+
+class FlakyChatClient(FakeChatClient):
+    """Fails the first two requests, then answers like FakeChatClient."""
+
+    failures = 2
+
+    def create_completion(self, messages, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            self.requests += 1
+            raise ConnectionError("provider unavailable")
+        return super().create_completion(messages, **kwargs)
+
+
+class BrokenChatClient(FakeChatClient):
+    def create_completion(self, messages, **kwargs):
+        self.requests += 1
+        raise ConnectionError("provider unavailable")
+
+
+class UnparsableChatClient(FakeChatClient):
+    """Answers packed requests with text that has no segments, single requests normally."""
+
+    def create_completion(self, messages, **kwargs):
+        response = super().create_completion(messages, **kwargs)
+        if "<译文片段" in response.content:
+            response.content = "sorry, I can't keep the numbering"
+        return response
+
+
+class SlowChatClient(FakeChatClient):
+    def __init__(self, stream=False):
+        super().__init__(latency=0.05, stream=stream)
+
+
+class CountingRateLimiter:
+    def __init__(self):
+        self.acquired = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, cancel_event=None):
+        with self.lock:
+            self.acquired += 1
+
+
+def test_translates_every_block(make_translator):
+    translator = make_translator()
+    total = untranslated_blocks(translator)
+    job = BatchTranslationJob(translator, concurrency=3)
+    job.run()
+
+    progress = job.progress()
+    assert progress["status"] == "finished"
+    assert (progress["total"], progress["done"], progress["failed"]) == (total, total, 0)
+    assert untranslated_blocks(translator) == 0
+    for record in translator.get_page_records(0):
+        assert record["translation"] == record["original"].upper()
+
+
+def test_retries_failed_requests_with_backoff(make_translator):
+    translator = make_translator(FlakyChatClient)
+    total = untranslated_blocks(translator)
+    job = BatchTranslationJob(translator, concurrency=1, max_retries=3, backoff=0.01)
+    job.run()
+
+    progress = job.progress()
+    assert progress["status"] == "finished"
+    assert (progress["done"], progress["failed"]) == (total, 0)
+    assert llm_requests(translator) == total + 2
+
+
+def test_gives_up_after_max_retries(make_translator):
+    translator = make_translator(BrokenChatClient, page_count=1, blocks_per_page=3)
+    total = untranslated_blocks(translator)
+    job = BatchTranslationJob(translator, concurrency=1, max_retries=2, backoff=0.01)
+    job.run()
+
+    progress = job.progress()
+    assert progress["status"] == "finished"
+    assert (progress["done"], progress["failed"]) == (0, total)
+    assert len(progress["errors"]) == total
+    assert llm_requests(translator) == total * 3
+
+
+def test_packed_requests_fall_back_to_single_blocks(make_translator):
+    translator = make_translator(UnparsableChatClient)
+    total = untranslated_blocks(translator)
+    job = BatchTranslationJob(translator, concurrency=2, pack_token_budget=10_000)
+    limiter = job.rate_limiter = CountingRateLimiter()
+    job.run()
+
+    progress = job.progress()
+    assert (progress["status"], progress["done"], progress["failed"]) == ("finished", total, 0)
+    for record in translator.get_page_records(0):
+        assert record["translation"] == record["original"].upper()
+    # 打包请求 + 每块一个回退请求，全部经过限流
+    assert llm_requests(translator) > total
+    assert limiter.acquired == llm_requests(translator)
+
+
+def test_rate_limiter_spaces_out_requests():
+    limiter = RateLimiter(rpm=1200)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 4 * 0.05 * 0.9
+
+
+def test_rate_limiter_wait_is_cancellable():
+    limiter = RateLimiter(rpm=1)
+    limiter.acquire()
+    cancel_event = threading.Event()
+    cancel_event.set()
+    start = time.monotonic()
+    limiter.acquire(cancel_event)
+    assert time.monotonic() - start < 1
+
+
+def test_cancel_stops_the_job(make_translator):
+    translator = make_translator(SlowChatClient, page_count=3, blocks_per_page=20)
+    job = BatchTranslationJob(translator, concurrency=1).start()
+    time.sleep(0.2)
+    job.cancel()
+    job.thread.join(timeout=5)
+
+    progress = job.progress()
+    assert not job.thread.is_alive()
+    assert progress["status"] == "cancelled"
+    assert untranslated_blocks(translator) > 0
+
+
+def test_save_errors_are_counted(make_translator, monkeypatch):
+    translator = make_translator(page_count=1)
+    total = untranslated_blocks(translator)
+
+    def save_translation(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(translator, "save_translation", save_translation)
+    job = BatchTranslationJob(translator, pack_token_budget=10_000)
+    job.run()
+
+    progress = job.progress()
+    assert (progress["done"], progress["failed"]) == (0, total)
+    assert "disk full" in progress["errors"][0]
+
+
+def test_crashed_workers_fail_the_job(make_translator, monkeypatch):
+    translator = make_translator(page_count=1)
+    job = BatchTranslationJob(translator, pack_token_budget=10_000)
+
+    def translate_and_save(items):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(job, "translate_and_save", translate_and_save)
+    job.run()
+
+    progress = job.progress()
+    assert progress["status"] == "failed"
+    assert progress["errors"] == ["unexpected"]
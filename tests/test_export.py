@@ -0,0 +1,64 @@
+import json
+import threading
+from pathlib import Path
+
+import pymupdf
+
+from benchmark import make_synthetic_pdf, make_translation_records, page_digest
+from export import export_parallel, export_serial
+from layout import extract_page_blocks
+
+
+def test_parallel_export_matches_serial(tmp_path):
+    pdf_path = str(tmp_path / "book.pdf")
+    make_synthetic_pdf(pdf_path, page_count=4, blocks_per_page=10)
+    with pymupdf.open(pdf_path) as doc:
+        pages_translations = [make_translation_records(extract_page_blocks(page)) for page in doc]
+
+    serial = export_serial(pdf_path, pages_translations, "helv", None)
+    parallel = export_parallel(pdf_path, pages_translations, "helv", None, workers=2)
+    assert [page_digest(page) for page in parallel] == [page_digest(page) for page in serial]
+    assert parallel.get_toc() == serial.get_toc()
+
+
+def test_concurrent_exports_leave_a_consistent_output(make_translator, tmp_path):
+    translator = make_translator(page_count=4, blocks_per_page=10)
+    for page_num in range(len(translator.doc)):
+        block = translator.get_page_info(page_num)["blocks"][0]
+        translator.save_translation(
+            page_num, 0, "译文", block["text"], block["originalRect"], block["font_size"], block["color"], 0
+        )
+    errors = []
+
+    def export(incremental):
+        try:
+            translator.generate_translated_pdf(incremental=incremental)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=export, args=(index % 2 == 1,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not list(tmp_path.glob("*.tmp"))
+    manifest = json.loads(Path(translator.get_export_manifest_path()).read_text(encoding="utf-8"))
+    assert manifest["pages"] == [translator.translations.page_fingerprint(page_num) for page_num in range(4)]
+    with pymupdf.open(translator.translated_pdf_path) as doc:
+        assert len(doc) == 4
+
+
+def test_merge_redactions_option_forces_a_full_export(make_translator):
+    translator = make_translator()
+    block = translator.get_page_info(0)["blocks"][0]
+    translator.save_translation(
+        0, 0, "译文", block["text"], block["originalRect"], block["font_size"], block["color"], 0
+    )
+    translator.generate_translated_pdf()
+    assert "up to date" in translator.generate_translated_pdf(incremental=True)
+    # 合并涂抹区域时页面的渲染结果不同，上一版输出不能复用
+    message = translator.generate_translated_pdf(incremental=True, merge_redactions=True)
+    assert "up to date" not in message and "pages updated" not in message
+    assert "up to date" in translator.generate_translated_pdf(incremental=True, merge_redactions=True)
@@ -0,0 +1,59 @@
+import random
+
+import pymupdf
+import pytest
+
+from benchmark import make_synthetic_pdf, make_translation_records
+from layout import extract_page_blocks
+from preview import render_page_raster
+
+
+def test_etag_changes_when_the_pdf_is_replaced(make_translator, tmp_path):
+    translator = make_translator()
+    etag = translator.get_preview_etag(0)
+    assert translator.get_preview_etag(0) == etag
+    translator.close()
+
+    make_synthetic_pdf(str(tmp_path / "book.pdf"), page_count=2, blocks_per_page=12, seed=1)
+    assert make_translator().get_preview_etag(0) != etag
+
+
+# helv 也是 PyMuPDF 生成的 PDF 里原文使用的字体名
+@pytest.mark.parametrize("font_name", ["helv", "tiro"])
+def test_incremental_raster_matches_a_full_render(tmp_path, font_name):
+    pdf_path = str(tmp_path / "page.pdf")
+    make_synthetic_pdf(pdf_path, page_count=1, blocks_per_page=40)
+    doc = pymupdf.open(pdf_path)
+    records = make_translation_records(extract_page_blocks(doc[0]))
+    rnd = random.Random(0)
+
+    raster = render_page_raster(doc, 0, 1.0, records, font_name, None)
+    for step in range(12):
+        record = rnd.choice(records)
+        if step % 3 == 0:
+            record["translation"] = " ".join(["overflowing"] * 30)
+        elif step % 3 == 1:
+            x0, y0, x1, y1 = record["new_rect"]
+            record["new_rect"] = [x0 + 5, y0 + 5, x1 + 30, y1 + 10]
+        else:
+            record["translation"] = record["translation"][: rnd.randint(1, 10)]
+        snapshot = [dict(record) for record in records]
+        raster = render_page_raster(doc, 0, 1.0, snapshot, font_name, None, raster)
+        full = render_page_raster(doc, 0, 1.0, snapshot, font_name, None)
+        assert raster.pixmap.digest == full.pixmap.digest, step
+    doc.close()
+
+
+def test_clipped_previews(make_translator, monkeypatch):
+    translator = make_translator()
+    with pytest.raises(ValueError):
+        translator.render_preview(0, 1.0, clip=(900, 900, 2000, 2000))
+
+    def render_page_translations(*args, **kwargs):
+        raise RuntimeError("render failed")
+
+    monkeypatch.setattr("translator.render_page_translations", render_page_translations)
+    with pytest.raises(RuntimeError):
+        translator.render_preview(0, 1.0, clip=(0, 0, 100, 100))
+    monkeypatch.undo()
+    assert translator.render_preview(0, 1.0, "png", clip=(0, 0, 100, 100)).startswith(b"\x89PNG")
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from jobs import JobManager
+from sessions import DocumentBusyError, TranslatorPool
+
+
+class FakeTranslator:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_busy_documents_are_not_removed():
+    busy = set()
+    pool = TranslatorPool(max_documents=2, is_busy=lambda translator: translator in busy)
+    translator = FakeTranslator()
+    pool.put("a", translator)
+    busy.add(translator)
+
+    with pytest.raises(DocumentBusyError):
+        pool.remove("a")
+    assert pool.get("a") is translator and not translator.closed
+
+    busy.clear()
+    assert pool.remove("a") and translator.closed
+    assert not pool.remove("a")
+
+
+def test_busy_documents_are_not_evicted():
+    busy = set()
+    pool = TranslatorPool(max_documents=1, is_busy=lambda translator: translator in busy)
+    first, second = FakeTranslator(), FakeTranslator()
+    pool.put("a", first)
+    busy.add(first)
+    pool.put("b", second)
+    assert not first.closed and pool.get("a") is first
+
+
+def test_finished_jobs_release_their_owner():
+    jobs = JobManager(max_workers=1)
+    owner = FakeTranslator()
+    release = threading.Event()
+    job = jobs.submit("wait", release.wait, owner=owner)
+    assert jobs.is_busy(owner)
+
+    release.set()
+    jobs.executor.shutdown(wait=True)
+    assert job.status == "finished" and job.owner is None
+    assert not jobs.is_busy(owner)
+
+
+def test_close_is_idempotent_and_frees_the_caches(make_translator):
+    translator = make_translator()
+    translator.preview_page(0, scale=0.5)
+    assert translator.preview_cache.images and translator.raster_cache.images
+
+    translator.close()
+    translator.close()
+    assert not translator.preview_cache.images and not translator.raster_cache.images
+    assert translator.raster_cache.total_bytes == 0
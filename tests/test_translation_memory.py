@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from benchmark import FakeChatClient
+from translation_memory import TranslationMemory
+
+
+class CountingChatClient(FakeChatClient):
+    """Numbers its answers, so a new request gives a different translation."""
+
+    def create_completion(self, messages, **kwargs):
+        response = super().create_completion(messages, **kwargs)
+        if self.stream:
+            content = "".join(chunk.content for chunk in response)
+            return iter([SimpleNamespace(content=f"{content} #{self.requests}")])
+        return SimpleNamespace(content=f"{response.content} #{self.requests}")
+
+
+def test_refresh_skips_the_memory(make_translator, tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.db"))
+    translator = make_translator(CountingChatClient, translation_memory=memory)
+
+    first = translator.translate_block("Chapter one")
+    assert translator.translate_block("Chapter one") == first
+    refreshed = translator.translate_block("Chapter one", use_memory=False)
+    assert refreshed != first
+    # 新的译文替换了记忆中的旧译文
+    assert translator.translate_block("Chapter one") == refreshed
+    requests = translator.client_pool.get("openai", stream=True).requests
+    event, streamed = list(translator.translate_block_stream("Chapter one", use_memory=False))[-1]
+    assert event == "done"
+    assert translator.client_pool.get("openai", stream=True).requests == requests + 1
+    assert translator.translate_block("Chapter one") == streamed
+
+
+def test_saved_translations_take_precedence(make_translator, tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.db"))
+    translator = make_translator(translation_memory=memory)
+    block = translator.get_page_info(0)["blocks"][0]
+    assert translator.translate_block(block["text"]) == block["text"].upper()
+
+    translator.save_translation(
+        0, 0, "corrected", block["text"], block["originalRect"], block["font_size"], block["color"], 0, remember=True
+    )
+    assert translator.translate_block(block["text"]) == "corrected"
+    assert translator.translate_blocks([block["text"]], ["openai", "another-model"]) == ["corrected"]
+    assert translator.translate_block(block["text"], use_memory=False) == block["text"].upper()
+
+
+def test_batch_saves_are_not_remembered(make_translator, tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.db"))
+    translator = make_translator(translation_memory=memory)
+    block = translator.get_page_info(0)["blocks"][0]
+    translator.save_translation(
+        0, 0, "draft", block["text"], block["originalRect"], block["font_size"], block["color"], 0
+    )
+    assert memory.get(block["text"], translator.target_language, "openai", "gpt-4o-mini") is None
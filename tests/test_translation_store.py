@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from translation_store import ShardedTranslationStore, TranslationConflictError
+
+
+def save(translator, page_num, index, translation):
+    block = translator.get_page_info(page_num)["blocks"][index]
+    translator.save_translation(
+        page_num, index, translation, block["text"], block["originalRect"], block["font_size"], block["color"], 0
+    )
+
+
+def saved_translations(translator):
+    with open(translator.output_json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [record["translation"] for page in data["pages"] for record in page["translations"]]
+
+
+def test_sqlite_changes_are_exported_periodically(make_translator):
+    translator = make_translator(translation_storage="sqlite")
+    translator.journal.compact_every = 3
+    for index in range(3):
+        save(translator, 0, index, f"译文 {index}")
+    assert saved_translations(translator) == ["译文 0", "译文 1", "译文 2"]
+    assert not translator.translations.has_unexported_changes()
+
+
+def test_json_storage_picks_up_unexported_sqlite_changes(make_translator):
+    # sqlite 实例没有关闭（例如进程被杀掉），修改只在数据库中
+    sqlite_translator = make_translator(translation_storage="sqlite")
+    save(sqlite_translator, 1, 0, "只在数据库中")
+
+    translator = make_translator()
+    assert [record["translation"] for record in translator.get_page_records(1)] == ["只在数据库中"]
+    assert saved_translations(translator) == ["只在数据库中"]
+
+
+def test_conflicting_changes_are_not_dropped(make_translator):
+    sqlite_translator = make_translator(translation_storage="sqlite")
+    save(sqlite_translator, 0, 0, "数据库")
+    sqlite_translator.translations.write_json(sqlite_translator.output_json_path)
+    save(sqlite_translator, 0, 1, "只在数据库中")
+
+    # 同时 translations.json 被 json 存储改动过
+    with open(sqlite_translator.output_json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["pages"][0]["translations"][0]["translation"] = "只在 JSON 中"
+    with open(sqlite_translator.output_json_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+    for translation_storage in ("json", "sqlite"):
+        with pytest.raises(TranslationConflictError):
+            make_translator(translation_storage=translation_storage)
+
+
+def test_sharded_store_keeps_edits_of_evicted_pages(tmp_path):
+    store = ShardedTranslationStore(str(tmp_path / "translations.db"), 2, max_pages=1)
+    record = {"rect": [0, 0, 10, 10], "original": "one", "translation": "一"}
+    store.upsert(0, dict(record))
+    store.upsert(1, dict(record))
+    store.upsert(0, dict(record, translation="壹"))
+    store.delete(1, record["rect"], record["original"])
+    store.memory.clear()
+    assert [record["translation"] for record in store.page_records(0)] == ["壹"]
+    assert store.page_records(1) == []
+    store.close()
+
+    with pytest.raises(ValueError):
+        ShardedTranslationStore(str(tmp_path / "translations.db"), 2, max_pages=0)
+
+
+def test_sqlite_storage_matches_blocks_with_a_small_cache(make_translator):
+    translator = make_translator(translation_storage="sqlite", translation_cache_pages=1)
+    save(translator, 0, 0, "译文")
+    blocks = translator.get_page_info(0)["blocks"]
+    assert blocks[0]["translation"] == "译文"
+    assert not any(block.get("is_extra") for block in blocks)
@@ -0,0 +1,166 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+
+NGRAM_SIZE = 3
+MAX_QUERY_NGRAMS = 500
+# 用户在编辑器里保存的译文以这个 provider 记录，不区分模型和额外要求
+USER_PROVIDER = "user"
+
+whitespace_re = re.compile(r"\s+")
+
+
+def normalize_text(text: str):
+    return whitespace_re.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def text_ngrams(normalized: str):
+    if len(normalized) <= NGRAM_SIZE:
+        return {normalized}
+    return {normalized[i : i + NGRAM_SIZE] for i in range(len(normalized) - NGRAM_SIZE + 1)}
+
+
+def memory_key(normalized: str, target_language: str, provider: str, model: str, extra_requirements: str):
+    raw = "\x1f".join((normalized, target_language, provider, model, extra_requirements))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Translations of previously seen source texts, shared across pages and documents.
+
+    Exact lookups are keyed by (normalized source text, target language, provider, model,
+    extra requirements). Translations saved by the user are stored under USER_PROVIDER and take
+    precedence over any model's translation of the same text. Character trigrams of every
+    source text are indexed too, so that suggest() can return near matches of texts that
+    differ slightly.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, source TEXT NOT NULL, "
+                "target_language TEXT NOT NULL, provider TEXT NOT NULL, model TEXT NOT NULL, "
+                "extra_requirements TEXT NOT NULL, translation TEXT NOT NULL, "
+                "ngram_count INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory_ngrams (ngram TEXT NOT NULL, memory_id INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS memory_ngrams_ngram ON memory_ngrams (ngram)")
+
+    def get(self, text: str, target_language: str, provider: str, model: str, extra_requirements: str = ""):
+        normalized = normalize_text(text)
+        user_key = memory_key(normalized, target_language, USER_PROVIDER, "", "")
+        key = memory_key(normalized, target_language, provider, model, extra_requirements)
+        with self.lock:
+            rows = dict(
+                self.conn.execute("SELECT key, translation FROM memory WHERE key IN (?, ?)", (user_key, key)).fetchall()
+            )
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return rows.get(user_key, rows.get(key))
+
+    def put_user_translation(self, text: str, translation: str, target_language: str):
+        self.put(text, translation, target_language, USER_PROVIDER, "", "")
+
+    def put(
+        self,
+        text: str,
+        translation: str,
+        target_language: str,
+        provider: str,
+        model: str,
+        extra_requirements: str = "",
+    ):
+        normalized = normalize_text(text)
+        key = memory_key(normalized, target_language, provider, model, extra_requirements)
+        ngrams = text_ngrams(normalized)
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT id FROM memory WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE memory SET translation = ?, updated_at = ? WHERE id = ?",
+                    (translation, time.time(), row[0]),
+                )
+                return
+            cursor = self.conn.execute(
+                "INSERT INTO memory (key, source, target_language, provider, model, extra_requirements, "
+                "translation, ngram_count, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    normalized,
+                    target_language,
+                    provider,
+                    model,
+                    extra_requirements,
+                    translation,
+                    len(ngrams),
+                    time.time(),
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO memory_ngrams (ngram, memory_id) VALUES (?, ?)",
+                [(ngram, cursor.lastrowid) for ngram in ngrams],
+            )
+
+    def suggest(self, text: str, target_language: str, min_similarity: float = 0.7, limit: int = 5):
+        """
+        Near matches for text in the target language, scored by trigram Dice similarity.
+        """
+        ngrams = text_ngrams(normalize_text(text))
+        # 控制 SQL 参数数量，超长文本只用部分 ngram 召回候选
+        query_ngrams = sorted(ngrams)[:MAX_QUERY_NGRAMS]
+        placeholders = ",".join("?" * len(query_ngrams))
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT memory.source, memory.translation, memory.provider, memory.model, "
+                "memory.ngram_count, COUNT(*) AS shared "
+                "FROM memory_ngrams JOIN memory ON memory.id = memory_ngrams.memory_id "
+                f"WHERE memory_ngrams.ngram IN ({placeholders}) AND memory.target_language = ? "
+                "GROUP BY memory.id ORDER BY shared DESC LIMIT ?",
+                (*query_ngrams, target_language, limit * 4),
+            ).fetchall()
+
+        suggestions = []
+        for source, translation, provider, model, ngram_count, shared in rows:
+            similarity = 2 * shared / (len(ngrams) + ngram_count)
+            if similarity >= min_similarity:
+                suggestions.append(
+                    {
+                        "source": source,
+                        "translation": translation,
+                        "provider": provider,
+                        "model": model,
+                        "similarity": round(similarity, 3),
+                    }
+                )
+        suggestions.sort(key=lambda suggestion: suggestion["similarity"], reverse=True)
+        return suggestions[:limit]
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
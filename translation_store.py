@@ -0,0 +1,370 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+
+RECT_NDIGITS = 2
+
+
+def record_key(rect, original: str):
+    """
+    Index key of a translation record: the rect rounded to RECT_NDIGITS plus the original text.
+    """
+    return tuple(round(float(value), RECT_NDIGITS) for value in rect), original
+
+
+def records_fingerprint(records: list):
+    records = json.dumps(records, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(records.encode("utf-8")).hexdigest()
+
+
+def index_records(records: list):
+    page = {}
+    for record in records:
+        # 与旧版线性查找保持一致：重复记录以第一条为准
+        page.setdefault(record_key(record["rect"], record["original"]), record)
+    return page
+
+
+class TranslationStore:
+    """
+    Translation records of a document, indexed by (page, rounded rect, original text).
+
+    Each page keeps its records in an insertion-ordered dict, so lookup, upsert and delete
+    are O(1) while to_dict() still produces the translations.json layout:
+    {"pages": [{"page_number": 0, "translations": [...]}, ...]}
+    """
+
+    def __init__(self, page_count: int):
+        self.pages = [{} for _ in range(page_count)]
+
+    @classmethod
+    def from_dict(cls, data: dict, page_count: int = 0):
+        store = cls(max(page_count, len(data.get("pages", []))))
+        for page_data in data.get("pages", []):
+            store.pages[page_data["page_number"]] = index_records(page_data["translations"])
+        return store
+
+    def to_dict(self):
+        return {
+            "pages": [
+                {"page_number": page_num, "translations": list(records.values())}
+                for page_num, records in enumerate(self.pages)
+            ]
+        }
+
+    def page_records(self, page_num: int):
+        return list(self._page(page_num).values())
+
+    def iter_page_records(self):
+        for page_num, records in enumerate(self.pages):
+            yield page_num, list(records.values())
+
+    def page_fingerprint(self, page_num: int):
+        """
+        Hash of the page's translation records, changes whenever any record of the page changes.
+        """
+        return records_fingerprint(self.page_records(page_num))
+
+    def get(self, page_num: int, rect, original: str):
+        return self._page(page_num).get(record_key(rect, original))
+
+    def upsert(self, page_num: int, record: dict):
+        """
+        Insert the record, or update the existing one with the same rect and original text in place.
+        """
+        key = record_key(record["rect"], record["original"])
+        page = self._page(page_num)
+        existing = page.get(key)
+        if existing is not None:
+            existing.update({field: value for field, value in record.items() if field != "rect"})
+            record = existing
+        else:
+            page[key] = record
+        self._page_changed(page_num, page)
+        return record
+
+    def delete(self, page_num: int, rect, original: str):
+        page = self._page(page_num)
+        record = page.pop(record_key(rect, original), None)
+        if record is not None:
+            self._page_changed(page_num, page)
+        return record
+
+    def apply(self, entry: dict):
+        """
+        Apply a journal entry produced by PDFTranslator.save_translation or delete_block.
+        """
+        if entry["op"] == "upsert":
+            self.upsert(entry["page_num"], entry["record"])
+        elif entry["op"] == "delete":
+            self.delete(entry["page_num"], entry["rect"], entry["original"])
+
+    def stats(self):
+        return {"memory_pages": len(self.pages), "pages": len(self.pages)}
+
+    def close(self):
+        pass
+
+    def _page(self, page_num: int):
+        return self.pages[page_num]
+
+    def _page_changed(self, page_num: int, page: dict):
+        pass
+
+
+class TranslationConflictError(Exception):
+    """
+    translations.json and the translations.db sidecar were both changed since they were last in sync.
+    """
+
+
+class ShardedTranslationStore(TranslationStore):
+    """
+    Translation records in a SQLite file, one row per page, loaded on demand.
+
+    Only the max_pages most recently used pages are kept in memory. Every change is written
+    to its page row at once, so there is no journal to replay and nothing to compact. The
+    fingerprint of each page is stored with it, so export checks don't load any records.
+
+    translations.json stays the exchange format: import_json() replaces the contents with a
+    translations.json file, write_json() writes one page by page. Both remember the size and
+    modification time of the file, so needs_import() tells when it was changed by someone else,
+    and has_unexported_changes() tells when the database has changes the file doesn't have.
+    """
+
+    def __init__(self, db_path: str, page_count: int, max_pages: int = 64):
+        if max_pages < 1:
+            raise ValueError(f"max_pages must be at least 1, got {max_pages}")
+        self.db_path = db_path
+        self.max_pages = max_pages
+        self.memory = OrderedDict()
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "page_num INTEGER PRIMARY KEY, records TEXT NOT NULL, fingerprint TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        last_page = self.conn.execute("SELECT MAX(page_num) FROM pages").fetchone()[0]
+        self.page_count = max(page_count, last_page + 1 if last_page is not None else 0)
+
+    def to_dict(self):
+        return {
+            "pages": [
+                {"page_number": page_num, "translations": records} for page_num, records in self.iter_page_records()
+            ]
+        }
+
+    def iter_page_records(self):
+        """
+        (page_num, records) of every page in order, read straight from the database.
+        """
+        with self.lock:
+            # 逐行读取游标，不会一次把整个数据库读进内存
+            rows = self.conn.execute("SELECT page_num, records FROM pages ORDER BY page_num")
+            row = next(rows, None)
+            for page_num in range(self.page_count):
+                if row is not None and row[0] == page_num:
+                    yield page_num, json.loads(row[1])
+                    row = next(rows, None)
+                else:
+                    yield page_num, []
+
+    def page_fingerprint(self, page_num: int):
+        with self.lock:
+            row = self.conn.execute("SELECT fingerprint FROM pages WHERE page_num = ?", (page_num,)).fetchone()
+        return row[0] if row is not None else records_fingerprint([])
+
+    def get(self, page_num: int, rect, original: str):
+        with self.lock:
+            return super().get(page_num, rect, original)
+
+    def upsert(self, page_num: int, record: dict):
+        with self.lock:
+            return super().upsert(page_num, record)
+
+    def delete(self, page_num: int, rect, original: str):
+        with self.lock:
+            return super().delete(page_num, rect, original)
+
+    def page_records(self, page_num: int):
+        with self.lock:
+            return super().page_records(page_num)
+
+    def import_json(self, json_path: str):
+        """
+        Replace all translations with the contents of a translations.json file.
+        Raises TranslationConflictError when the database has changes that were never exported.
+        """
+        if self.has_unexported_changes():
+            raise TranslationConflictError(
+                f"{self.db_path} has changes that are not in {json_path}, which was changed too"
+            )
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM pages")
+                for page_data in data.get("pages", []):
+                    records = list(index_records(page_data["translations"]).values())
+                    if records:
+                        self._write_page(page_data["page_number"], records)
+                self._remember_json(json_path)
+            self.memory.clear()
+            self.page_count = max(self.page_count, len(data.get("pages", [])))
+
+    def write_json(self, json_path: str):
+        """
+        Atomically write all translations in the translations.json layout, one page at a time.
+        """
+
+        def write_pages(f):
+            f.write('{\n    "pages": [')
+            for page_num, records in self.iter_page_records():
+                page = json.dumps({"page_number": page_num, "translations": records}, ensure_ascii=False, indent=4)
+                # 与 json.dump(indent=4) 的输出保持一致
+                f.write(("," if page_num else "") + "\n        " + page.replace("\n", "\n        "))
+            f.write("\n    ]\n}")
+
+        with self.lock:
+            atomic_write(json_path, write_pages)
+            with self.conn:
+                self._remember_json(json_path)
+
+    def needs_import(self, json_path: str):
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return False
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'json_stat'").fetchone()
+        return row is None or row[0] != self._json_stat(json_path)
+
+    def has_unexported_changes(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'json_outdated'").fetchone()
+        return row is not None and row[0] == "1"
+
+    def stats(self):
+        with self.lock:
+            return {"memory_pages": len(self.memory), "max_pages": self.max_pages, "pages": self.page_count}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _page(self, page_num: int):
+        page = self.memory.get(page_num)
+        if page is not None:
+            self.memory.move_to_end(page_num)
+            return page
+        if not 0 <= page_num < self.page_count:
+            raise IndexError(f"page {page_num} out of range")
+        row = self.conn.execute("SELECT records FROM pages WHERE page_num = ?", (page_num,)).fetchone()
+        page = index_records(json.loads(row[0])) if row is not None else {}
+        self.memory[page_num] = page
+        while len(self.memory) > self.max_pages:
+            self.memory.popitem(last=False)
+        return page
+
+    def _page_changed(self, page_num: int, page: dict):
+        # 用刚修改过的 page 写入，再调用 _page 可能因为它已被移出内存而读到旧的一行
+        with self.conn:
+            self._write_page(page_num, list(page.values()))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_outdated', '1')")
+
+    def _write_page(self, page_num: int, records: list):
+        if not records:
+            self.conn.execute("DELETE FROM pages WHERE page_num = ?", (page_num,))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (page_num, records, fingerprint) VALUES (?, ?, ?)",
+            (page_num, json.dumps(records, ensure_ascii=False), records_fingerprint(records)),
+        )
+
+    def _remember_json(self, json_path: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_stat', ?)", (self._json_stat(Path(json_path)),)
+        )
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_outdated', '0')")
+
+    @staticmethod
+    def _json_stat(json_path: Path):
+        stat = json_path.stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def atomic_write_json(path: str, data, **kwargs):
+    """
+    Write JSON to a temporary file in the same folder and rename it over path,
+    so readers never see a half-written file.
+    """
+    atomic_write(path, lambda f: json.dump(data, f, **kwargs))
+
+
+def atomic_write(path: str, write):
+    """
+    Call write(f) on a temporary text file in the same folder and rename it over path.
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+class TranslationJournal:
+    """
+    Append-only log of translation changes, one JSON object per line.
+
+    Changes are appended here instead of rewriting the whole translations.json, which is
+    only rewritten on compaction. Replaying is idempotent, so a crash between writing the
+    compacted file and clearing the journal loses nothing.
+    """
+
+    def __init__(self, journal_path: str, compact_every: int = 200):
+        self.journal_path = Path(journal_path)
+        self.compact_every = compact_every
+        self.entry_count = 0
+        self.lock = threading.Lock()
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.entry_count += 1
+
+    def should_compact(self):
+        return self.entry_count >= self.compact_every
+
+    def replay(self, store: TranslationStore):
+        if not self.journal_path.exists():
+            return 0
+        with self.lock:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程在写入过程中退出时最后一行可能不完整
+                        continue
+                    store.apply(entry)
+                    self.entry_count += 1
+        return self.entry_count
+
+    def clear(self):
+        with self.lock:
+            self.journal_path.unlink(missing_ok=True)
+            self.entry_count = 0
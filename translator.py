@@ -0,0 +1,658 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pymupdf
+
+from export import export_serial, export_parallel, export_incremental
+from fonts import DocumentFont
+from layout import LayoutCache, file_hash, extract_page_blocks, is_valid_text
+from metrics import metrics, span, usage_tokens
+from packing import build_packed_content, parse_packed_result
+from prefetch import PagePrefetcher
+from preview import PreviewCache, RasterCache, encode_pixmap, render_page_raster
+from render import pymupdf_lock, render_page_translations
+from sessions import ChatClientPool
+from translation_memory import TranslationMemory
+from translation_store import (
+    TranslationStore,
+    ShardedTranslationStore,
+    TranslationConflictError,
+    TranslationJournal,
+    atomic_write_json,
+    record_key,
+)
+
+if TYPE_CHECKING:
+    from vectorvein.chat_clients import BaseChatClient
+
+
+translation_extract_re = re.compile(r"<.*?>(.*?)</.*?>", re.DOTALL)
+
+
+def clean_translation(result: str):
+    if translation_extract_re.match(result):
+        return translation_extract_re.match(result).group(1)
+    else:
+        return result
+
+
+class PDFTranslator:
+    def __init__(
+        self,
+        pdf_path: str,
+        output_json_path: str,
+        translated_pdf_path: str,
+        font_name: str,
+        font_file: str,
+        target_language: str,
+        model_selection: list,
+        translation_memory: TranslationMemory | None = None,
+        client_pool: ChatClientPool | None = None,
+        prefetch_radius: int = 2,
+        translation_storage: str = "json",
+        translation_cache_pages: int = 64,
+    ):
+        if translation_storage not in ("json", "sqlite"):
+            raise ValueError(f"Unsupported translation storage: {translation_storage}")
+        self.pdf_path = pdf_path
+        self.output_json_path = output_json_path
+        self.translated_pdf_path = translated_pdf_path
+        self.font_name = font_name
+        self.font_file = font_file
+        self.target_language = target_language
+        self.model_selection = model_selection
+        self.translation_memory = translation_memory
+        # 保护 translations，pymupdf 的调用由 render.pymupdf_lock 保护
+        self.lock = threading.RLock()
+        self.export_lock = threading.Lock()
+        self.closed = False
+        with pymupdf_lock:
+            self.doc = pymupdf.open(pdf_path)
+        self.layout_cache = LayoutCache(self.get_layout_cache_path(), file_hash(pdf_path))
+        self.current_page = 0
+        self.translation_storage = translation_storage
+        self.translation_cache_pages = translation_cache_pages
+        self.translations = TranslationStore(len(self.doc))
+        # sqlite 存储下还没有导出到 translations.json 的修改数
+        self.unexported_changes = 0
+        self.journal = TranslationJournal(self.get_journal_path())
+        self.preview_cache = PreviewCache()
+        self.raster_cache = RasterCache()
+        self.prefetcher = PagePrefetcher(self.load_page_blocks, len(self.doc), radius=prefetch_radius)
+        # LLM 客户端在第一次翻译时才创建，只导出或预览时不用加载 LLM SDK
+        self.client_pool = client_pool or ChatClientPool()
+        self.load_progress()
+
+    def get_layout_cache_path(self):
+        output_json_path = Path(self.output_json_path)
+        return str(output_json_path.with_name(f"{output_json_path.stem}.layout.db"))
+
+    def get_export_manifest_path(self):
+        translated_pdf_path = Path(self.translated_pdf_path)
+        return str(translated_pdf_path.with_name(f"{translated_pdf_path.stem}.export.json"))
+
+    def get_translation_db_path(self):
+        output_json_path = Path(self.output_json_path)
+        return str(output_json_path.with_name(f"{output_json_path.stem}.translations.db"))
+
+    def get_journal_path(self):
+        output_json_path = Path(self.output_json_path)
+        return str(output_json_path.with_name(f"{output_json_path.stem}.journal.jsonl"))
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.prefetcher.close()
+        # 关闭后的实例可能还被已结束的任务引用，先释放占内存最多的图像缓存
+        self.preview_cache.clear()
+        self.raster_cache.clear()
+        with self.lock:
+            if self.journal.entry_count or self.unexported_changes:
+                self.save_progress()
+            self.translations.close()
+        self.layout_cache.close()
+        with pymupdf_lock:
+            self.doc.close()
+
+    def load_progress(self):
+        """
+        With the json storage, translations.json is loaded into memory. With sqlite, pages are
+        loaded on demand from the translations.db sidecar, and translations.json is imported
+        only when it is newer than the database (first use, or edited with the json storage).
+
+        Changes that are only in the database (the sqlite storage was not closed cleanly) are
+        exported to translations.json before the json storage loads it. When both were changed,
+        TranslationConflictError is raised instead of dropping either.
+        """
+        db_path = self.get_translation_db_path()
+        if self.translation_storage == "sqlite" or Path(db_path).exists():
+            store = ShardedTranslationStore(db_path, len(self.doc), max_pages=self.translation_cache_pages)
+            try:
+                if self.translation_storage == "sqlite":
+                    if store.needs_import(self.output_json_path):
+                        store.import_json(self.output_json_path)
+                elif store.has_unexported_changes():
+                    if store.needs_import(self.output_json_path):
+                        raise TranslationConflictError(
+                            f"{db_path} has changes that are not in {self.output_json_path}, which was changed too"
+                        )
+                    store.write_json(self.output_json_path)
+            except BaseException:
+                store.close()
+                raise
+            if self.translation_storage == "sqlite":
+                self.translations = store
+            else:
+                store.close()
+        if self.translation_storage == "json" and Path(self.output_json_path).exists():
+            with open(self.output_json_path, "r", encoding="utf-8") as f:
+                self.translations = TranslationStore.from_dict(json.load(f), page_count=len(self.doc))
+        # 重放上次压缩之后记录的修改
+        if self.journal.replay(self.translations):
+            self.save_progress()
+
+    def save_progress(self):
+        """
+        Compact: atomically rewrite the whole translations.json and clear the journal.
+        With the sqlite storage the database is always up to date, translations.json is written
+        page by page from it.
+        """
+        # 持锁直到日志清空，避免压缩期间写入的修改随日志一起丢失
+        with self.lock, span("save_progress"):
+            if self.translation_storage == "sqlite":
+                self.translations.write_json(self.output_json_path)
+            else:
+                atomic_write_json(self.output_json_path, self.translations.to_dict(), ensure_ascii=False, indent=4)
+            self.journal.clear()
+            self.unexported_changes = 0
+
+    def log_change(self, entry: dict):
+        with self.lock:
+            if self.translation_storage == "sqlite":
+                # 修改已经写入数据库，translations.json 每隔 compact_every 次修改和关闭文档时导出
+                self.unexported_changes += 1
+                if self.unexported_changes >= self.journal.compact_every:
+                    self.save_progress()
+                return
+            self.journal.append(entry)
+            if self.journal.should_compact():
+                self.save_progress()
+
+    def load_page_blocks(self, page_num, remember=True):
+        """
+        Prefetcher callback: extract and cache the layout of page_num unless it is cached already.
+        Returns whether the page was extracted.
+        """
+        if self.layout_cache.warm(page_num, remember):
+            return False
+        with pymupdf_lock:
+            if self.layout_cache.warm(page_num, remember):
+                return False
+            with span("extract_layout"):
+                page_blocks = extract_page_blocks(self.doc[page_num])
+            self.layout_cache.put(page_num, page_blocks, remember)
+        return True
+
+    def get_page_info(self, page_num):
+        with pymupdf_lock:
+            page = self.doc[page_num]
+            page_width, page_height = page.rect.width, page.rect.height
+            page_blocks = self.layout_cache.get(page_num)
+            if page_blocks is None:
+                with span("extract_layout"):
+                    page_blocks = extract_page_blocks(page)
+                self.layout_cache.put(page_num, page_blocks)
+        # 用户多半会翻到相邻的页面，后台提前提取
+        self.prefetcher.request(page_num)
+        with self.lock, span("match_translations"):
+            valid_blocks = self.match_page_blocks(page_num, page_blocks)
+        return {"blocks": valid_blocks, "width": page_width, "height": page_height}
+
+    def translation_stats(self):
+        stats = {"pages": len(self.doc), "translated_pages": 0, "records": 0, "translated_records": 0}
+        with self.lock:
+            # 逐页统计，sqlite 存储下不会把所有页面同时读进内存
+            for _, records in self.translations.iter_page_records():
+                stats["translated_pages"] += bool(records)
+                stats["records"] += len(records)
+                stats["translated_records"] += sum(1 for record in records if record.get("translation") is not None)
+            fingerprints = [self.translations.page_fingerprint(page_num) for page_num in range(len(self.doc))]
+        changed_pages = self.get_changed_pages(fingerprints)
+        # None：没有可以增量更新的导出文件
+        stats["pages_to_export"] = sorted(changed_pages) if changed_pages is not None else None
+        return stats
+
+    def page_cache_stats(self):
+        return {
+            "layout": self.layout_cache.stats(),
+            "prefetch": self.prefetcher.stats(),
+            "translations": self.translations.stats(),
+        }
+
+    def match_page_blocks(self, page_num, page_blocks):
+        valid_blocks = []
+        matched_records = set()
+        for block_info in page_blocks:
+            # Check if this block has been translated
+            translated_block = self.translations.get(page_num, block_info["rect"], block_info["text"])
+            if translated_block:
+                block_info["translation"] = translated_block["translation"]
+                block_info["translated"] = translated_block["translation"] is not None
+                block_info["rect"] = translated_block.get("new_rect") or block_info["rect"]
+                block_info["align"] = translated_block.get("align", pymupdf.TEXT_ALIGN_LEFT)
+                if block_info.get("font_size") != translated_block.get("font_size"):
+                    block_info["font_size"] = translated_block.get("font_size")
+                if block_info.get("color") != translated_block.get("color"):
+                    block_info["color"] = translated_block.get("color")
+                matched_records.add(record_key(translated_block["rect"], translated_block["original"]))
+            else:
+                block_info["translated"] = False
+            valid_blocks.append(block_info)
+
+        # 没有匹配到原文 block 的翻译记录作为额外的 block 返回
+        for record in self.translations.page_records(page_num):
+            # 按记录的键比较，分片存储两次读取同一页得到的可能不是同一个对象
+            if record_key(record["rect"], record["original"]) in matched_records:
+                continue
+            extra_block = dict(record)
+            extra_block["text"] = extra_block["original"]
+            extra_block["translated"] = extra_block["translation"] is not None
+            extra_block["originalRect"] = extra_block["rect"]
+            extra_block["rect"] = extra_block.get("new_rect") or extra_block["rect"]
+            extra_block["align"] = extra_block.get("align", pymupdf.TEXT_ALIGN_LEFT)
+            extra_block["is_extra"] = True
+            valid_blocks.append(extra_block)
+
+        return valid_blocks
+
+    def is_valid_text(self, text):
+        return is_valid_text(text)
+
+    def get_provider_model(self, model_selection: list | None = None):
+        if model_selection is None:
+            model_selection = self.model_selection
+        return model_selection[0].lower(), model_selection[1].lower()
+
+    def get_client(self, provider: str):
+        client: "BaseChatClient" = self.client_pool.get(provider)
+        return client
+
+    def get_stream_client(self, provider: str):
+        client: "BaseChatClient" = self.client_pool.get(provider, stream=True)
+        return client
+
+    def get_system_prompt(self, extra_requirements: str = ""):
+        book_name = Path(self.pdf_path).stem
+        system_prompt = f"你是专业的书籍翻译员，你需要对这本《{book_name}》进行翻译。翻译时务必根据这本书的内容进行翻译，保持信达雅。请根据用户的输入片段直接输出翻译结果，不要解释。"
+        if extra_requirements:
+            system_prompt += f"\n\n额外要求: {extra_requirements}"
+        return system_prompt
+
+    def get_memorized_translation(self, text: str, provider: str, model: str, extra_requirements: str):
+        if self.translation_memory is None:
+            return None
+        return self.translation_memory.get(text, self.target_language, provider, model, extra_requirements)
+
+    def memorize_translation(self, text: str, translation: str, provider: str, model: str, extra_requirements: str):
+        if self.translation_memory is not None:
+            self.translation_memory.put(text, translation, self.target_language, provider, model, extra_requirements)
+
+    def get_translation_messages(self, text: str, extra_requirements: str = ""):
+        return [
+            {"role": "system", "content": self.get_system_prompt(extra_requirements)},
+            {
+                "role": "user",
+                "content": f"<原文片段>{text}</原文片段>\n\n<要求>目标语言：{self.target_language}\n直接输出翻译结果，不需要用XML标签包裹。</要求>",
+            },
+        ]
+
+    def create_completion(self, provider: str, model: str, messages: list):
+        """
+        One non-streaming LLM request, recorded in the LLM latency and token metrics.
+        """
+        try:
+            with span("llm") as llm_span:
+                response = self.get_client(provider).create_completion(messages=messages, model=model, temperature=0.2)
+        except Exception:
+            metrics.observe_llm_error(provider, model)
+            raise
+        prompt_tokens, completion_tokens = usage_tokens(getattr(response, "usage", None), messages, response.content)
+        metrics.observe_llm(provider, model, llm_span.ms, prompt_tokens, completion_tokens)
+        return response
+
+    def request_translation(
+        self, text: str, provider: str, model: str, extra_requirements: str = "", before_request=None
+    ):
+        messages = self.get_translation_messages(text, extra_requirements)
+        if before_request is not None:
+            before_request()
+
+        response = self.create_completion(provider, model, messages)
+        return clean_translation(response.content)
+
+    def translate_block(
+        self, text: str, model_selection: list | None = None, extra_requirements: str = "", use_memory: bool = True
+    ):
+        """
+        Translate one block. With use_memory=False the translation memory is not looked up,
+        so a new translation is requested, and it replaces the memorized one.
+        """
+        provider, model = self.get_provider_model(model_selection)
+        translation = self.get_memorized_translation(text, provider, model, extra_requirements) if use_memory else None
+        if translation is None:
+            translation = self.request_translation(text, provider, model, extra_requirements)
+            self.memorize_translation(text, translation, provider, model, extra_requirements)
+        return translation
+
+    def translate_block_stream(
+        self, text: str, model_selection: list | None = None, extra_requirements: str = "", use_memory: bool = True
+    ):
+        """
+        Yield ("delta", partial_content) while the completion streams in, then ("done", translation)
+        with the same cleanup and use_memory as translate_block.
+        """
+        provider, model = self.get_provider_model(model_selection)
+        translation = self.get_memorized_translation(text, provider, model, extra_requirements) if use_memory else None
+        if translation is None:
+            client = self.get_stream_client(provider)
+            messages = self.get_translation_messages(text, extra_requirements)
+            result = ""
+            usage = None
+            first_token_ms = None
+            start = time.perf_counter()
+            try:
+                for chunk in client.create_completion(messages=messages, model=model, temperature=0.2):
+                    usage = getattr(chunk, "usage", None) or usage
+                    if chunk.content:
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - start) * 1000
+                        result += chunk.content
+                        yield "delta", chunk.content
+            except Exception:
+                metrics.observe_llm_error(provider, model)
+                raise
+            llm_ms = (time.perf_counter() - start) * 1000
+            metrics.observe_span("llm_stream", llm_ms)
+            metrics.observe_llm(provider, model, llm_ms, *usage_tokens(usage, messages, result), first_token_ms)
+            translation = clean_translation(result)
+            self.memorize_translation(text, translation, provider, model, extra_requirements)
+        yield "done", translation
+
+    def translate_blocks(
+        self,
+        texts: list[str],
+        model_selection: list | None = None,
+        extra_requirements: str = "",
+        before_request=None,
+    ):
+        """
+        Translate several blocks with one request, using numbered segments.
+        Texts found in the translation memory are not sent, and if the segments can't be
+        parsed back, every text falls back to its own request.
+        before_request() is called before every LLM request, batch jobs use it for rate limiting.
+        """
+        provider, model = self.get_provider_model(model_selection)
+        translations = [self.get_memorized_translation(text, provider, model, extra_requirements) for text in texts]
+        missing = [index for index, translation in enumerate(translations) if translation is None]
+        if not missing:
+            return translations
+
+        missing_texts = [texts[index] for index in missing]
+        if len(missing_texts) == 1:
+            results = [
+                self.request_translation(missing_texts[0], provider, model, extra_requirements, before_request)
+            ]
+        else:
+            messages = [
+                {"role": "system", "content": self.get_system_prompt(extra_requirements)},
+                {"role": "user", "content": build_packed_content(missing_texts, self.target_language)},
+            ]
+            if before_request is not None:
+                before_request()
+            response = self.create_completion(provider, model, messages)
+            results = parse_packed_result(response.content, len(missing_texts))
+            if results is None:
+                results = [
+                    self.request_translation(text, provider, model, extra_requirements, before_request)
+                    for text in missing_texts
+                ]
+
+        for index, translation in zip(missing, results):
+            translations[index] = translation
+            self.memorize_translation(texts[index], translation, provider, model, extra_requirements)
+        return translations
+
+    def delete_block(self, page_num, rect, original):
+        with self.lock:
+            if self.translations.delete(page_num, rect, original) is not None:
+                self.log_change({"op": "delete", "page_num": page_num, "rect": rect, "original": original})
+
+    def save_translation(
+        self,
+        page_num,
+        block_index,
+        translation,
+        original,
+        rect,
+        font_size,
+        color,
+        align,
+        new_rect=None,
+        remember=False,
+    ):
+        """
+        Save the translation of a block. With remember (translations saved by the user in the
+        editor), it is also put in the translation memory, so repeated texts such as headers
+        get the corrected translation from then on.
+        """
+        record = {
+            "original": original,
+            "translation": translation,
+            "rect": rect,
+            "new_rect": new_rect if new_rect else rect,
+            "font_size": font_size,
+            "color": color,
+            "align": align,
+        }
+        # Insert a new record, or update the existing record of this block on the given page
+        with self.lock:
+            self.translations.upsert(page_num, dict(record))
+            self.log_change({"op": "upsert", "page_num": page_num, "record": record})
+        if remember and translation and self.translation_memory is not None:
+            self.translation_memory.put_user_translation(original, translation, self.target_language)
+
+    def get_page_records(self, page_num):
+        """
+        Copies of the translation records of a page, safe to use while other requests edit it.
+        """
+        with self.lock:
+            return [dict(record) for record in self.translations.page_records(page_num)]
+
+    def get_changed_pages(self, fingerprints: list, merge_redactions: bool = False):
+        """
+        Pages whose translations changed since the last export, according to the export manifest
+        written next to the translated PDF. None when the previous output can't be reused:
+        no manifest or output file, another source PDF, other font settings or page count.
+        """
+        manifest_path = Path(self.get_export_manifest_path())
+        if not manifest_path.exists() or not Path(self.translated_pdf_path).exists():
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            manifest.get("pdf_hash") != self.layout_cache.pdf_hash
+            or manifest.get("font_name") != self.font_name
+            or manifest.get("font_file") != self.font_file
+            or manifest.get("merge_redactions", False) != merge_redactions
+            or len(manifest.get("pages", [])) != len(fingerprints)
+        ):
+            return None
+        return {
+            page_num for page_num, fingerprint in enumerate(fingerprints) if manifest["pages"][page_num] != fingerprint
+        }
+
+    def generate_translated_pdf(
+        self, workers: int = 1, incremental: bool = False, fast_save: bool = False, merge_redactions: bool = False
+    ):
+        """
+        Render every page's translations into a copy of the source PDF and save it.
+        With workers > 1 the pages are rendered in chunks by a process pool, see export.py,
+        using at most one process per CPU.
+
+        With incremental, only pages whose translations changed since the last export are
+        rendered again and the others are copied from the previous output. A full export is
+        done instead when the previous output can't be reused or most pages changed.
+        fast_save skips the expensive garbage collection and cleaning of the PDF objects,
+        the file is somewhat larger. merge_redactions merges overlapping redaction rects of a
+        page before applying them, see render.redact_page.
+        """
+        # 进程数超过 CPU 核数只会多花启动子进程的时间，单核时直接串行导出
+        workers = min(workers, os.cpu_count() or 1)
+        # 同一个文档的导出依次进行：两个导出交错时，后替换的 PDF 可能和清单中的指纹对不上
+        with self.export_lock:
+            with self.lock:
+                fingerprints = [self.translations.page_fingerprint(page_num) for page_num in range(len(self.doc))]
+                changed_pages = self.get_changed_pages(fingerprints, merge_redactions) if incremental else None
+                if changed_pages is not None and not changed_pages:
+                    return f"Translated PDF is up to date: {self.translated_pdf_path}"
+                # 大部分页面都变了时，整体重新导出更快，文件也更紧凑
+                if changed_pages is not None and len(changed_pages) > len(fingerprints) / 2:
+                    changed_pages = None
+                # 增量导出只读取改动页面的记录，其他页面不用从存储中加载
+                pages_translations = [
+                    self.get_page_records(page_num) if changed_pages is None or page_num in changed_pages else []
+                    for page_num in range(len(self.doc))
+                ]
+
+            with span("export_render"):
+                if changed_pages is not None:
+                    doc = export_incremental(
+                        self.pdf_path,
+                        self.translated_pdf_path,
+                        pages_translations,
+                        changed_pages,
+                        self.font_name,
+                        self.font_file,
+                        merge_redactions=merge_redactions,
+                    )
+                elif workers > 1:
+                    doc = export_parallel(
+                        self.pdf_path,
+                        pages_translations,
+                        self.font_name,
+                        self.font_file,
+                        workers,
+                        merge_redactions=merge_redactions,
+                    )
+                else:
+                    doc = export_serial(
+                        self.pdf_path,
+                        pages_translations,
+                        self.font_name,
+                        self.font_file,
+                        merge_redactions=merge_redactions,
+                    )
+            # 先写临时文件再替换，增量导出读取的上一版输出在保存失败时不会损坏
+            translated_pdf_path = Path(self.translated_pdf_path)
+            temp_path = translated_pdf_path.with_name(
+                f".{translated_pdf_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            try:
+                with pymupdf_lock, span("export_save"):
+                    if fast_save:
+                        doc.save(str(temp_path), garbage=1, deflate=True)
+                    else:
+                        doc.save(str(temp_path), garbage=4, deflate=True, clean=True)
+                    doc.close()
+                os.replace(temp_path, translated_pdf_path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+            atomic_write_json(
+                self.get_export_manifest_path(),
+                {
+                    "pdf_hash": self.layout_cache.pdf_hash,
+                    "font_name": self.font_name,
+                    "font_file": self.font_file,
+                    "merge_redactions": merge_redactions,
+                    "pages": fingerprints,
+                },
+            )
+            if changed_pages is not None:
+                return f"Translated PDF saved to {self.translated_pdf_path} ({len(changed_pages)} pages updated)"
+            return f"Translated PDF saved to {self.translated_pdf_path}"
+
+    def get_preview_etag(self, page_num, scale=2.0, image_format="png", quality=80, clip=None):
+        with self.lock:
+            fingerprint = self.translations.page_fingerprint(page_num)
+        # 同一路径下替换了 PDF 时 doc_id 不变，源文件的哈希保证 ETag 跟着变
+        key = (
+            f"{self.layout_cache.pdf_hash}:{page_num}:{scale}:{image_format}:{quality}:{clip}:"
+            f"{self.font_name}:{self.font_file}:{fingerprint}"
+        )
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def preview_page(self, page_num, scale=2.0, image_format="png", quality=80, clip=None):
+        # Only pages whose translations or render options changed are rendered again
+        etag = self.get_preview_etag(page_num, scale, image_format, quality, clip)
+        img_byte_arr = self.preview_cache.get(etag)
+        if img_byte_arr is None:
+            img_byte_arr = self.render_preview(page_num, scale, image_format, quality, clip)
+            self.preview_cache.put(etag, img_byte_arr)
+        return img_byte_arr
+
+    def render_preview(self, page_num, scale=2.0, image_format="png", quality=80, clip=None):
+        """
+        Render the translated page as an image. With clip (page coordinates), only that region
+        is rasterized, for tiles of zoomed views.
+
+        Full pages are rendered incrementally: the raster of the previous preview is kept and
+        only the areas of changed blocks are rasterized again, see preview.render_page_raster.
+        """
+        page_translations = self.get_page_records(page_num)
+        if clip is None:
+            with pymupdf_lock:
+                # 先从缓存取出，渲染出错时不会留下更新了一半的图像
+                previous = self.raster_cache.pop((page_num, scale))
+                with span("rasterize"):
+                    raster = render_page_raster(
+                        self.doc, page_num, scale, page_translations, self.font_name, self.font_file, previous
+                    )
+                self.raster_cache.put((page_num, scale), raster)
+                with span("encode_image"):
+                    return encode_pixmap(raster.pixmap, image_format, quality)
+
+        # 临时文档在出错时也会被关闭
+        with pymupdf_lock, pymupdf.open() as temp_doc:
+            # Create a temporary PDF with just the requested page
+            temp_doc.insert_pdf(self.doc, from_page=page_num, to_page=page_num)
+            temp_page = temp_doc[0]
+
+            clip = pymupdf.Rect(clip) & temp_page.rect
+            if clip.is_empty:
+                raise ValueError("clip is outside the page")
+
+            # Apply translations to the temporary page
+            render_page_translations(temp_page, page_translations, DocumentFont(self.font_name, self.font_file))
+
+            # Render the page to an image with increased resolution
+            with span("rasterize"):
+                mat = pymupdf.Matrix(scale, scale)  # Increase scale for higher resolution
+                pix = temp_page.get_pixmap(matrix=mat, clip=clip, alpha=False)
+
+            # 直接从 Pixmap 编码，不再复制到 PIL 图像
+            with span("encode_image"):
+                img_byte_arr = encode_pixmap(pix, image_format, quality)
+
+        return img_byte_arr